@@ -8,6 +8,24 @@ import subprocess
 import time
 import pathlib
 import os, sys
+import threading
+import queue
+import shlex
+import hashlib
+import tempfile
+import sqlite3
+import itertools
+import heapq
+import pickle
+import hmac
+import secrets
+import zlib
+import re
+import signal
+import statistics
+from collections import deque
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
 
 '''Represents a function contained in the header file of an api:
     -name represents the name of the function
@@ -35,6 +53,16 @@ class Function:
     def addReverseDependency(self, dependency):
         self.reverseDependencies.append(dependency)
 
+    # the parts of the declaration harnesses depend on, compared across library versions by --incremental
+    def signature(self):
+        types = []
+        for mult_type in [self.mult_ret] + self.mult_args:
+            if mult_type is None:
+                types.append("None")
+            else:
+                types.append(f"{'const ' if mult_type.const else ''}{mult_type.base_type}{'*' * mult_type.pointers}/{mult_type.typedef_pointers}")
+        return f"{self.category} {types[0]}({', '.join(types[1:])})"
+
     def __str__(self):
         retstring = self.name + "\nDependencies:\n"
         for dep in self.dependencies:
@@ -81,6 +109,37 @@ class APIfunctions:
         if funcName in self.processingFunctions:
             return self.processingFunctions[funcName]
 
+    def signatures(self):
+        return {func.name: func.signature() for func in self.getAllFunctions()}
+
+    # the given functions plus every function that may be called after one of them, directly or through others
+    def dependents(self, funcNames):
+        found = set(name for name in funcNames if self.getFunction(name))
+        function_queue = list(found)
+        while len(function_queue):
+            for dep in self.getFunction(function_queue.pop(0)).dependencies:
+                if not dep.otherfunctionName in found:
+                    found.add(dep.otherfunctionName)
+                    function_queue.append(dep.otherfunctionName)
+        return found
+
+    # number of calls needed to get from each function to funcName along the dependencies, functions that can't reach it
+    # are left out
+    def distancesTo(self, funcName):
+        callers = {}
+        for func in self.getAllFunctions():
+            for dep in func.dependencies:
+                callers.setdefault(dep.otherfunctionName, set()).add(func.name)
+        distances = {funcName: 0}
+        function_queue = [funcName]
+        while len(function_queue):
+            curr_func = function_queue.pop(0)
+            for caller in callers.get(curr_func, set()):
+                if not caller in distances:
+                    distances[caller] = distances[curr_func] + 1
+                    function_queue.append(caller)
+        return distances
+
     def initFunctions(self):
         return [func.name for func in self.getAllFunctions() if "INIT" in func.name.upper()]
 
@@ -105,14 +164,17 @@ class Sequence:
         self.functionsCalled = dict()
         self.functionCount = 0
         self.effectiveness = 0
-        self.bitmap = set()
+        self.bitmap = 0
         self.cCode = None
+        self.cTemplate = None  # cCode with the literal arguments left as slots, filled in from slotValues
+        self.slotValues = []
         self.fuzzDataUsed = False
         self.functionPointerDeclarations = dict()
         self.func_targeted = False
         self.setupLen = None
         self.uninteresting_setup = False
         self.seedCov = dict()
+        self.targets = set()  # with --target_func, the targeted functions this sequence calls
 
     '''Update the dictionary for class function calls'''
 
@@ -168,8 +230,9 @@ class SequenceMember:
 
 
 class literal_arg:
-    def __init__(self, value):
+    def __init__(self, value, integer=False):
         self.value = value
+        self.integer = integer  # known to be an integer constant, e.g. an enum constant or a macro expanding to one
 
     def __eq__(self, other):
         return self.value == other.value
@@ -683,7 +746,10 @@ class CheckCompatibility:
 
 
 class ConvertToC:
-    def __init__(self, sequence, includes, hardcodedvars, functions, read_from_buffer, compatibility, add_define_to_harness):
+    # inputs a persistent harness process handles before AFL re-forks it, bounding state leaked across seeds
+    persistent_iterations = 1000
+
+    def __init__(self, sequence, includes, hardcodedvars, functions, read_from_buffer, compatibility, add_define_to_harness, persistent=False, parameterize=False):
         self.sequence = sequence
         self.includes = includes
         self.hardcodedvars = hardcodedvars
@@ -692,6 +758,9 @@ class ConvertToC:
         self.file = C.cfile("program.c")
         self.compatibility = compatibility
         self.add_define_to_harness = add_define_to_harness
+        self.persistent = persistent
+        self.parameterize = parameterize
+        self.slotValues = []
         self.type_to_val = {}
         self.map_type_to_val()
 
@@ -717,6 +786,8 @@ class ConvertToC:
         for x in self.includes:
             self.file.code.append(C.line("#include " + x))
         self.file.code.append(C.blank())
+        if self.persistent:
+            self.addPersistentFallback()
         
 
     '''adds the main function declaration to the file'''
@@ -735,6 +806,8 @@ class ConvertToC:
         body = C.block(innerIndent=3)
         for func in self.functions.getAllFunctions():
             funcDict[func.name] = 1
+        if self.persistent:
+            body.append(f"\twhile (__AFL_LOOP({self.persistent_iterations})) {{")
         if self.read_from_buffer:
             self.addReadFromBuffer(body)
         else:
@@ -749,6 +822,9 @@ class ConvertToC:
             argindex = 0
             for args in func.args:
                 currVal = args.value
+                if self.parameterize and self.isSlot(args):
+                    currVal = f"__OGHARN_SLOT_{len(self.slotValues)}__"
+                    self.slotValues.append(args.value)
                 currCall.add_arg(currVal)
                 argindex += 1
             func2call = C.statement(currCall)
@@ -765,9 +841,21 @@ class ConvertToC:
             self.addArgChecks(body, func.args) # adding pre-check for arguments that dereference a pointer
             body.append(C.statement(func2statement))
             self.addChecks(body, function, func.args, name)
+        if self.persistent:
+            # each iteration reads its input into a fresh buffer
+            if self.read_from_buffer:
+                body.append("\tfree(fuzzData);")
+            body.append("\t}")
         body.append(C.statement('return 0'))
         self.file.code.append(body)
 
+    # integer literals, enum constants and integer macros can be read from a table at runtime instead of being compiled in.
+    # Any other identifier might be a pointer, string or struct that a long long slot can't hold
+    def isSlot(self, arg):
+        if isinstance(arg, literal_arg) and getattr(arg, "integer", False):
+            return True
+        return re.fullmatch(r"-?(0[xX][0-9a-fA-F]+|\d+)[uUlL]*", arg.value) is not None
+
     def addArgChecks(self, body, args):
         argindex = 0
         for param in args:
@@ -861,6 +949,17 @@ class ConvertToC:
     if(fread(fuzzData, (size_t)size, 1, f) != 1)
         exit(0);
     fuzzData[size] = \'\\0\';''')
+        # the persistent loop re-opens the file for every input, so the handle can't outlive the iteration
+        if self.persistent:
+            body.append("\tfclose(f);")
+
+    # lets persistent harnesses still be built by a plain compiler, where the loop body runs exactly once
+    def addPersistentFallback(self):
+        self.file.code.append(C.line('''#ifndef __AFL_LOOP
+static int __ogharn_iterations = 0;
+#define __AFL_LOOP(_A) (!__ogharn_iterations++)
+#endif'''))
+        self.file.code.append(C.blank())
 
     def passFileArg(self, body):
         body.append("   char *fuzzData = argv[1];")
@@ -982,9 +1081,794 @@ class BuildDependencies:
             post_arg_index += 1
 
 
+'''A Makefile recipe expanded once with `make -n` into an argv and environment template. Executing the template directly skips
+the shell and the re-parse of the user's Makefile on every compile and every coverage run'''
+
+
+class Recipe:
+    placeholders = {"OUT": "__OGHARN_OUT__", "SEED": "__OGHARN_SEED__", "SEEDS": "__OGHARN_SEEDS__"}
+
+    def __init__(self, target, argv, env):
+        self.target = target
+        self.argv = argv
+        self.env = env
+
+    # returns None whenever the recipe can't be faithfully represented as a single command, callers then go through make
+    @staticmethod
+    def expand(input_dir, target):
+        variables = " ".join(f"{name}={value}" for name, value in Recipe.placeholders.items())
+        proc = subprocess.run(f"cd {input_dir} && {variables} make -n --no-print-directory {target}", stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True, shell=True)
+        if proc.returncode:
+            return None
+        lines = [line for line in proc.stdout.splitlines() if line.strip()]
+        # multi-command recipes, prerequisites being rebuilt or make's own messages all need the real thing
+        if len(lines) != 1 or lines[0].startswith("make"):
+            return None
+        line = lines[0]
+        if any(c in line for c in "$`*?[]{}~\\"):
+            return None
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            return None
+        if any(all(c in "();<>|&" for c in token) for token in tokens):
+            return None
+        env = {}
+        while len(tokens) and "=" in tokens[0] and tokens[0].split("=")[0].isidentifier():
+            name, value = tokens.pop(0).split("=", 1)
+            env[name] = value
+        if not len(tokens):
+            return None
+        return Recipe(target, tokens, env)
+
+    def command(self, values):
+        argv = []
+        for token in self.argv:
+            argv.append(Recipe.substitute(token, values))
+        env = {name: Recipe.substitute(value, values) for name, value in self.env.items()}
+        return argv, env
+
+    @staticmethod
+    def substitute(token, values):
+        for name, placeholder in Recipe.placeholders.items():
+            if placeholder in token:
+                token = token.replace(placeholder, values.get(name, ""))
+        return token
+
+
+'''Persistent, content-addressed store of compiled harnesses shared across candidates and campaigns. Entries are keyed by the
+harness source, the resolved compile command and a fingerprint of the compiler and libraries it links against, and hold
+either the compiled binary or the compiler's error output'''
+
+
+class CompileCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.fingerprints = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    header_suffixes = (".h", ".hh", ".hpp", ".hxx", ".inc")
+
+    # the size and mtime of the compiler, of the libraries the command links against (in its -L directories or given by
+    # path) and of the headers under its include directories
+    def fingerprint(self, recipe):
+        if recipe.target in self.fingerprints:
+            return self.fingerprints[recipe.target]
+        paths = []
+        if compiler := shutil.which(recipe.argv[0]):
+            paths.append(compiler)
+        paths += CompileCache.libraries(recipe.argv)
+        for include_dir in CompileCache.directories(recipe.argv, ["-I", "-isystem", "-iquote", "-idirafter"]):
+            for root, dirs, files in os.walk(include_dir):
+                dirs.sort()
+                paths += [f"{root}/{name}" for name in sorted(files) if name.endswith(CompileCache.header_suffixes)]
+        fingerprint = CompileCache.statFingerprint(paths)
+        self.fingerprints[recipe.target] = fingerprint
+        return fingerprint
+
+    # the existing directories given to any of the flags, either as -Xdir or as -X dir
+    @staticmethod
+    def directories(argv, flags):
+        found = []
+        for i in range(0, len(argv)):
+            for flag in flags:
+                directory = None
+                if argv[i] == flag and i + 1 < len(argv):
+                    directory = argv[i + 1]
+                elif argv[i].startswith(flag) and len(argv[i]) > len(flag):
+                    directory = argv[i][len(flag):]
+                if directory and os.path.isdir(directory) and directory not in found:
+                    found.append(directory)
+        return found
+
+    @staticmethod
+    def isLibrary(name):
+        return ".so" in name or name.endswith(".a")
+
+    # everything that looks like a library in the -L directories of a command, and libraries it names by path
+    @staticmethod
+    def libraries(argv):
+        paths = []
+        for lib_dir in CompileCache.directories(argv, ["-L"]):
+            paths += [f"{lib_dir}/{lib}" for lib in sorted(os.listdir(lib_dir)) if CompileCache.isLibrary(lib)]
+        for token in argv:
+            token = token[2:] if token.startswith("-l:") else token
+            if os.path.isabs(token) and os.path.isfile(token) and CompileCache.isLibrary(os.path.basename(token)):
+                paths.append(token)
+        return paths
+
+    @staticmethod
+    def statFingerprint(paths):
+        fingerprint = ""
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint += f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n"
+        return fingerprint
+
+    def key(self, recipe, source):
+        digest = hashlib.sha256()
+        for part in [recipe.target, "\0".join(recipe.argv), str(sorted(recipe.env.items())), self.fingerprint(recipe), source]:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    # returns (returncode, stderr) on a hit, copying a cached binary to dest, or None on a miss
+    def lookup(self, key, dest):
+        if os.path.exists(f"{self.cache_dir}/{key}.out"):
+            shutil.copy2(f"{self.cache_dir}/{key}.out", dest)
+            return 0, ""
+        if os.path.exists(f"{self.cache_dir}/{key}.err"):
+            with open(f"{self.cache_dir}/{key}.err", "r") as err:
+                returncode = int(err.readline())
+                return returncode, err.read()
+        return None
+
+    # only real compiler diagnostics are cached as failures, a compiler that was killed, ran out of memory or found the disk
+    # full may well succeed next time
+    def store(self, key, returncode, stderr, binary):
+        if returncode and re.search(r"\berror:", stderr) is None:
+            return
+        # entries are written to a temporary file first so concurrent workers never observe a partial one
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        os.close(fd)
+        if not returncode:
+            if not os.path.exists(binary):
+                os.remove(tmp)
+                return
+            shutil.copy2(binary, tmp)
+            os.replace(tmp, f"{self.cache_dir}/{key}.out")
+        else:
+            with open(tmp, "w") as err:
+                err.write(f"{returncode}\n{stderr}")
+            os.replace(tmp, f"{self.cache_dir}/{key}.err")
+
+
+'''Coverage of previously executed (harness binary, seed) pairs, persisted as an sqlite database in the output directory. Both are
+identified by the digest of their contents, so entries stay valid for cached binaries, reruns and rebuilt final harnesses'''
+
+
+class CoverageCache:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=OFF")
+        # databases from before coverage was stored as a hex bitset, or before crash reports were kept, can't be read back
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < 2:
+            self.db.execute("DROP TABLE IF EXISTS coverage")
+            self.db.execute("PRAGMA user_version = 2")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS coverage (binary TEXT, seed TEXT, target TEXT, returncode INTEGER,
+                           stdout TEXT, stderr TEXT, bitmap TEXT, report TEXT, PRIMARY KEY (binary, seed, target))""")
+        self.db.commit()
+
+    @staticmethod
+    def digest(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # returns (returncode, stdout, stderr state, bitmap, crash report) or None if the pair was never executed
+    def lookup(self, binary, seed, target):
+        with self.lock:
+            row = self.db.execute("SELECT returncode, stdout, stderr, bitmap, report FROM coverage WHERE binary=? AND seed=? AND target=?",
+                                  (binary, seed, target)).fetchone()
+        if row is None:
+            return None
+        returncode, stdout, stderr_state, bitmap, report = row
+        return returncode, stdout, stderr_state, (int(bitmap, 16) if bitmap is not None else None), report
+
+    # the report is the harness's stderr for crashing executions, so a replayed crash still gets its signature
+    def store(self, binary, seed, target, returncode, stdout, stderr_state, bitmap, report=""):
+        bitmap = format(bitmap, "x") if bitmap is not None else None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (binary, seed, target, returncode, stdout, stderr_state, bitmap, report))
+            self.db.commit()
+
+
+'''Campaign-wide trie of call sequences that failed to compile or crashed. Every sequence extending one of them
+carries the same code up to the failure, so it fails the same way and isn't worth generating'''
+
+
+class FailedPrefixes:
+    def __init__(self):
+        self.root = {}
+        self.lock = threading.Lock()
+        self.log = None  # set to a list to also collect every addition, which queue workers report back
+
+    def add(self, members, kind, detail):
+        self.addKeys([str(member) for member in members], kind, detail)
+
+    def addKeys(self, keys, kind, detail):
+        with self.lock:
+            node = self.root
+            for key in keys:
+                node = node.setdefault(key, {})
+            node[None] = (kind, detail)
+            if self.log is not None:
+                self.log.append((list(keys), kind, detail))
+
+    # returns (kind, detail) for the shortest failed prefix of members, or None
+    def match(self, members):
+        with self.lock:
+            node = self.root
+            for member in members:
+                node = node.get(str(member))
+                if node is None:
+                    return None
+                if None in node:
+                    return node[None]
+        return None
+
+
+'''Campaign-wide outcomes of the argument values tried for each (function, argument index) slot: how often a candidate using
+the value was tried, compiled and ran cleanly, gained coverage, or crashed. Argument tuples are sampled toward values
+that paid off, while explore_rate of the draws stay uniform so that unpromising values still get retried'''
+
+
+class ArgumentStats:
+    # what a candidate earns each of its argument values. Crashing candidates are discarded like any other failure
+    rewards = {"coverage": 1.0, "clean": 0.25}
+    prior = 0.5
+
+    def __init__(self, explore_rate=1.0):
+        self.explore_rate = explore_rate
+        self.slots = {}  # (function name, argument index) -> {value: [tried, clean, coverage, crashed]}
+
+    def record(self, funcName, args, outcome):
+        for argindex, arg in enumerate(args):
+            counts = self.slots.setdefault((funcName, argindex), {}).setdefault(arg.value, [0, 0, 0, 0])
+            counts[0] += 1
+            if outcome in ["clean", "coverage"]:
+                counts[1] += 1
+            if outcome == "coverage":
+                counts[2] += 1
+            elif outcome == "crash":
+                counts[3] += 1
+
+    # mean reward with one prior trial, so values that were never tried rank between ones that paid off and ones that failed
+    def score(self, funcName, argindex, value):
+        tried, clean, coverage, _ = self.slots.get((funcName, argindex), {}).get(value, [0, 0, 0, 0])
+        reward = coverage * self.rewards["coverage"] + (clean - coverage) * self.rewards["clean"]
+        return (reward + self.prior) / (tried + 1)
+
+    def choose(self, funcName, argindex, values, k=1):
+        if (funcName, argindex) not in self.slots or random.random() < self.explore_rate:
+            return random.choices(values, k=k)
+        weights = [self.score(funcName, argindex, getattr(value, "value", value)) for value in values]
+        return random.choices(values, weights=weights, k=k)
+
+
+'''Queue of rendered candidates shared by a coordinating campaign and any number of workers, kept in an sqlite database on
+a filesystem they all see. Workers claim candidates, evaluate them in their own workspaces and store the results back.
+A claim that isn't completed within the lease, e.g. because its worker died, is handed out again, and only the result of the
+latest claim is accepted. Every payload is authenticated with a key only the campaign's user can read, so that nothing
+written to the database by anyone else is ever unpickled'''
+
+
+class CampaignQueue:
+    lease = 1800
+    poll_interval = 0.5
+    version = 1
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.key = CampaignQueue.loadKey(path)
+        self.tokens = {}  # candidate id -> token of this process's current claim on it
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < CampaignQueue.version:
+            self.db.execute("DROP TABLE IF EXISTS candidates")
+            self.db.execute("DROP TABLE IF EXISTS settings")
+            self.db.execute(f"PRAGMA user_version = {CampaignQueue.version}")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS candidates (id INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB, state TEXT,
+                           worker TEXT, claimed REAL, token TEXT, result BLOB)""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value BLOB)")
+
+    # the key comes from $OGHARN_QUEUE_KEY or from <queue>.key, created by whichever process opens the queue first. A key file
+    # anyone but its owner could have planted or read is refused
+    @staticmethod
+    def loadKey(path):
+        if os.environ.get("OGHARN_QUEUE_KEY"):
+            return os.environ["OGHARN_QUEUE_KEY"].encode()
+        key_path = f"{path}.key"
+        try:
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as key_file:
+                key_file.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        st = os.stat(key_path)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError(f"{key_path} must be owned by the current user and not accessible to anyone else")
+        with open(key_path, "r") as key_file:
+            return key_file.read().strip().encode()
+
+    # payloads are stored behind an HMAC over what they are, so one can't be passed off as another
+    def seal(self, value, *context):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return hmac.new(self.key, repr(context).encode() + b"\0" + data, hashlib.sha256).digest() + data
+
+    def unseal(self, blob, *context):
+        if blob is None or len(blob) < 32:
+            return False, None
+        mac, data = blob[:32], blob[32:]
+        if not hmac.compare_digest(mac, hmac.new(self.key, repr(context).encode() + b"\0" + data, hashlib.sha256).digest()):
+            print(f"WARNING: Ignoring a queue entry that failed authentication: {context}")
+            return False, None
+        return True, pickle.loads(data)
+
+    def publish(self, name, value):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (name, self.seal(value, "setting", name)))
+
+    def setting(self, name):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return self.unseal(row[0], "setting", name)[1] if row else None
+
+    def submit(self, sequences):
+        ids = []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            for sequence in sequences:
+                id = self.db.execute("INSERT INTO candidates (state) VALUES ('pending')").lastrowid
+                self.db.execute("UPDATE candidates SET payload = ? WHERE id = ?", (self.seal(sequence, "candidate", id), id))
+                ids.append(id)
+            self.db.execute("COMMIT")
+        return ids
+
+    # returns [(id, sequence)] for up to limit candidates, oldest first. Candidates that fail authentication are marked rejected
+    def claim(self, worker, limit):
+        claimed = []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute("""SELECT id, payload FROM candidates WHERE state = 'pending' OR (state = 'claimed' AND claimed < ?)
+                                      ORDER BY id LIMIT ?""", (time.time() - self.lease, limit)).fetchall()
+            for id, payload in rows:
+                valid, sequence = self.unseal(payload, "candidate", id)
+                if not valid:
+                    self.db.execute("UPDATE candidates SET state = 'rejected' WHERE id = ?", (id,))
+                    continue
+                self.tokens[id] = secrets.token_hex(16)
+                self.db.execute("UPDATE candidates SET state = 'claimed', worker = ?, claimed = ?, token = ? WHERE id = ?",
+                                (worker, time.time(), self.tokens[id], id))
+                claimed.append((id, sequence))
+            self.db.execute("COMMIT")
+        return claimed
+
+    # a result is only stored while this process still holds the claim, a late one from an expired lease is dropped
+    def complete(self, id, result):
+        with self.lock:
+            token = self.tokens.pop(id, None)
+            self.db.execute("UPDATE candidates SET state = 'done', result = ? WHERE id = ? AND state = 'claimed' AND token = ?",
+                            (self.seal(result, "result", id, token), id, token))
+
+    # returns {id: result} for the given candidates that are done, and removes them from the queue. Candidates whose payload
+    # or result failed authentication are returned with None, for the coordinator to evaluate itself
+    def collect(self, ids):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(f"""SELECT id, state, token, result FROM candidates WHERE state IN ('done', 'rejected')
+                                       AND id IN ({', '.join('?' * len(ids))})""", ids).fetchall()
+            self.db.executemany("DELETE FROM candidates WHERE id = ?", [(row[0],) for row in rows])
+            self.db.execute("COMMIT")
+        results = {}
+        for id, state, token, result in rows:
+            results[id] = self.unseal(result, "result", id, token)[1] if state == "done" else None
+        return results
+
+    # drops whatever an earlier coordinator on the same queue left behind
+    def reset(self):
+        with self.lock:
+            self.db.execute("DELETE FROM candidates")
+            self.db.execute("DELETE FROM settings")
+
+    def close(self):
+        self.publish("closed", True)
+
+
+'''Unique crashes seen during the campaign, identified by a signature of the sanitizer report (the kind of error and the
+top library frames). The first candidate and seed to reach a signature are kept as its reproducer under crashes/. Every
+crashing call sequence is remembered as a prefix, since any candidate starting with it runs into the same crash'''
+
+
+class CrashDatabase:
+    frame_pattern = re.compile(r"#(\d+)\s+0x[0-9a-fA-F]+\s+(?:in\s+(\S+)|\((\S+?)\+(0x[0-9a-fA-F]+)\))")
+    runtime_prefixes = ("__asan", "__interceptor", "___interceptor", "__sanitizer", "__ubsan", "__msan", "__lsan")
+
+    def __init__(self, output_dir):
+        self.dir = f"{output_dir}/crashes"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(f"{output_dir}/crashes.db", check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS crashes (signature TEXT PRIMARY KEY, kind TEXT, frames TEXT, seed TEXT,
+                           reproducer TEXT, hits INTEGER)""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS prefixes (prefix TEXT PRIMARY KEY, signature TEXT, seed TEXT)")
+        self.db.commit()
+        self.prefixes = {prefix: (signature, seed) for prefix, signature, seed in self.db.execute("SELECT * FROM prefixes")}
+
+    @staticmethod
+    def prefix(members):
+        return "\n".join(str(member) for member in members)
+
+    # reduces a sanitizer report to (kind, frames). Only the first stack is read. Harness frames on top of it are the sanitizer
+    # interceptors linked into the binary and are skipped, harness frames below the library are left out so that the same bug
+    # reached from different harnesses gets the same signature. A stack that never reaches the library (e.g. a statically
+    # linked binary) is signed by its top harness frames instead
+    @staticmethod
+    def parse(report, stdout):
+        kind = None
+        if (match := re.search(r"ERROR: (\w+Sanitizer): ([\w-]+)", report)) is not None:
+            kind = f"{match.group(1)}: {match.group(2)}"
+        elif (match := re.search(r"runtime error: ([^\n]+)", report)) is not None:
+            kind = "UndefinedBehaviorSanitizer: " + re.sub(r"0x[0-9a-fA-F]+|\d+", "N", match.group(1))
+        elif (match := re.search(r"signal (\d+)", stdout)) is not None:
+            kind = f"signal {match.group(1)}"
+        else:
+            kind = "crash"
+        frames = []
+        harness_frames = []
+        for match in CrashDatabase.frame_pattern.finditer(report):
+            number, function, module, offset = match.groups()
+            if number == "0" and (len(frames) or len(harness_frames)):
+                break
+            if function is not None:
+                if function.startswith(CrashDatabase.runtime_prefixes):
+                    continue
+                frame = function
+                in_harness = function == "main" or function.startswith("ogharn_candidate")
+            else:
+                module = os.path.basename(module)
+                if "clang_rt" in module:
+                    continue
+                frame = f"{module}+{offset}"
+                in_harness = module.startswith("harness")
+            if in_harness:
+                if len(frames):
+                    break
+                harness_frames.append(frame)
+                continue
+            frames.append(frame)
+            if len(frames) == 3:
+                break
+        return kind, frames if len(frames) else harness_frames[:3]
+
+    # records the crash of a candidate on a seed, saving a reproducer if the signature is new. Returns the signature
+    def record(self, sequence, seed_path, report, stdout):
+        kind, frames = CrashDatabase.parse(report, stdout)
+        signature = hashlib.sha256("\n".join([kind] + frames).encode()).hexdigest()[:16]
+        seed = os.path.basename(seed_path)
+        prefix = CrashDatabase.prefix(sequence.sequenceMembers)
+        with self.lock:
+            self.prefixes[prefix] = (signature, seed)
+            self.db.execute("INSERT OR REPLACE INTO prefixes VALUES (?, ?, ?)", (prefix, signature, seed))
+            new = self.db.execute("SELECT 1 FROM crashes WHERE signature=?", (signature,)).fetchone() is None
+            if new:
+                reproducer = f"{self.dir}/{signature}"
+                os.makedirs(reproducer, exist_ok=True)
+                with open(f"{reproducer}/harness.c", "w") as file:
+                    file.write(sequence.cCode)
+                with open(f"{reproducer}/report.txt", "w") as file:
+                    file.write(stdout + report)
+                shutil.copy2(seed_path, f"{reproducer}/{seed}")
+                self.db.execute("INSERT INTO crashes VALUES (?, ?, ?, ?, ?, 1)", (signature, kind, "\n".join(frames), seed, reproducer))
+            else:
+                self.db.execute("UPDATE crashes SET hits = hits + 1 WHERE signature=?", (signature,))
+            self.db.commit()
+        return signature
+
+
+'''Private working copy of a seed directory that harnesses are executed on. It is populated once per campaign and, after an
+execution, only seeds whose contents no longer match the original are restored rather than re-copying the whole directory'''
+
+
+class SeedStore:
+    def __init__(self, original_dir, store_dir):
+        self.original_dir = original_dir
+        self.dir = store_dir
+        self.seeds = sorted(seed for seed in os.listdir(original_dir) if os.path.isfile(f"{original_dir}/{seed}"))
+        self.corpus = list(self.seeds)
+        self.digests = {}
+        self.stats = {}
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        os.makedirs(store_dir)
+        for seed in self.seeds:
+            self.digests[seed] = CoverageCache.digest(f"{original_dir}/{seed}")
+            self.copy(seed)
+
+    def copy(self, seed):
+        path = f"{self.dir}/{seed}"
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+        shutil.copy2(f"{self.original_dir}/{seed}", path)
+        self.stats[seed] = self.stat(seed)
+
+    def stat(self, seed):
+        try:
+            st = os.lstat(f"{self.dir}/{seed}")
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns, st.st_mode
+
+    # a seed whose metadata is untouched is trusted, one that was touched is only re-copied if its contents actually changed
+    def restore(self, seeds=None):
+        for seed in (self.seeds if seeds is None else seeds):
+            current = self.stat(seed)
+            if current == self.stats[seed]:
+                continue
+            if current is not None and current[2] == self.stats[seed][2] and CoverageCache.digest(f"{self.dir}/{seed}") == self.digests[seed]:
+                self.stats[seed] = current
+                continue
+            self.copy(seed)
+        if seeds is None:
+            # files a harness dropped next to the seeds would otherwise be picked up by afl-showmap -i
+            for entry in set(os.listdir(self.dir)).difference(self.seeds):
+                if os.path.isdir(f"{self.dir}/{entry}"):
+                    shutil.rmtree(f"{self.dir}/{entry}")
+                else:
+                    os.remove(f"{self.dir}/{entry}")
+
+    # drops a seed from the store for the rest of the campaign. The list is replaced rather than modified so that executions
+    # already iterating over it are unaffected
+    def quarantine(self, seed):
+        if seed not in self.seeds:
+            return
+        self.seeds = [s for s in self.seeds if s != seed]
+        if os.path.lexists(f"{self.dir}/{seed}"):
+            os.remove(f"{self.dir}/{seed}")
+
+    # brings every seed of the original corpus back into the store, seeds that are still quarantined are dropped again
+    # before the store's next use
+    def readmit(self):
+        for seed in self.corpus:
+            if seed not in self.seeds:
+                self.copy(seed)
+        self.seeds = list(self.corpus)
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+'''AFL coverage map in a System V shared memory segment, attached to this process. Harnesses instrumented by afl-clang-fast
+write their edge counts into it when started with __AFL_SHM_ID, which is what afl-showmap does for every execution.
+A workspace keeps one segment and clears it between seeds'''
+
+
+class ShmCoverage:
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_EXCL = 0o2000
+    IPC_RMID = 0
+
+    def __init__(self, map_size):
+        self.map_size = map_size
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        self.libc.shmget.restype = ctypes.c_int
+        self.libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        self.libc.shmat.restype = ctypes.c_void_p
+        self.libc.shmdt.argtypes = [ctypes.c_void_p]
+        self.libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        self.id = self.libc.shmget(ShmCoverage.IPC_PRIVATE, map_size, ShmCoverage.IPC_CREAT | ShmCoverage.IPC_EXCL | 0o600)
+        if self.id < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed for the coverage map")
+        self.addr = self.libc.shmat(self.id, None, 0)
+        if self.addr is None or self.addr == ctypes.c_void_p(-1).value:
+            errno = ctypes.get_errno()
+            self.libc.shmctl(self.id, ShmCoverage.IPC_RMID, None)
+            raise OSError(errno, "shmat failed for the coverage map")
+        # marked for removal right away, so the segment goes away with its last detach even if OGHarn is killed. Linux
+        # still lets the harnesses attach it through __AFL_SHM_ID until then
+        self.libc.shmctl(self.id, ShmCoverage.IPC_RMID, None)
+        self.map = (ctypes.c_ubyte * map_size).from_address(self.addr)
+
+    def clear(self):
+        ctypes.memset(self.addr, 0, self.map_size)
+
+    def read(self):
+        return bytes(self.map)
+
+    def close(self):
+        if self.addr is not None:
+            self.libc.shmdt(self.addr)
+            self.addr = None
+
+
+'''Scratch directory a single candidate harness is written, compiled and executed in. Workers evaluating candidates
+concurrently each own one, so generated sources, binaries, showmap output and seed copies never collide'''
+
+
+class Workspace:
+    def __init__(self, gen_dir, seeds_valid, seeds_invalid):
+        self.gen_dir = gen_dir
+        self.seeds_valid = seeds_valid
+        self.seeds_invalid = seeds_invalid
+        self.candidate = None  # which candidate of a fused binary is being executed
+        self.collector = None  # shared-memory coverage map, created on first use
+
+    # environment selecting the candidate in a fused binary, passed through afl-showmap to the harness
+    def env(self):
+        if self.candidate is None:
+            return {}
+        return {"OGHARN_CANDIDATE": str(self.candidate)}
+
+    def tag(self, target):
+        if self.candidate is None:
+            return target
+        return f"{target}#{self.candidate}"
+
+
+'''Outcome of executing a harness on a single seed. bitmap is None when the seed's coverage should not be considered'''
+
+
+class SeedResult:
+    def __init__(self, seed, returncode, stdout, bitmap, hung=False, report=""):
+        self.seed = seed
+        self.returncode = returncode
+        self.stdout = stdout
+        self.bitmap = bitmap
+        self.hung = hung
+        self.report = report  # the harness's stderr when it crashed, normally a sanitizer report
+
+
+'''Best-first frontier of partial harness sequences waiting to be extended with further calls. A sequence's priority is the
+coverage it gained when it was kept, scaled by how often extending its last function has paid off so far and discounted by its
+depth and by the number of candidate calls extending it will cost. With targeted functions, sequences are also discounted
+by how many calls away they are from the nearest target that no harness reaches yet. The campaign stops expanding once
+its time or candidate budget runs out'''
+
+
+class Scheduler:
+    unreachable_distance = 10  # how far away a sequence that can't reach any target is treated as
+
+    def __init__(self, budget=None, exec_budget=None, snapshot_interval=None):
+        self.budget = budget
+        self.exec_budget = exec_budget
+        self.snapshot_interval = snapshot_interval
+        self.frontier = []
+        self.order = itertools.count()  # ties are broken in the order sequences were queued
+        self.expansions = {}  # function name -> [times sequences ending in it were extended, times that kept a harness]
+        self.start = time.time()
+        self.lastSnapshot = self.start
+        self.targets = set()
+        self.reached = set()  # targets some kept harness calls
+
+    def priority(self, sequence, gain, cost, distances):
+        expanded, productive = self.expansions.get(sequence.sequenceMembers[-1].name, (0, 0))
+        history = (productive + 1) / (expanded + 2)
+        return gain * history / ((1 + cost) * (1 + sequence.functionCount) * (1 + self.distance(distances)))
+
+    # distances maps each target to how many calls away from it the sequence is. Once every target is reached, the
+    # remaining budget goes to sequences around any of them
+    def distance(self, distances):
+        if not len(self.targets):
+            return 0
+        targets = (self.targets - self.reached) or self.targets
+        return min([distances[target] for target in targets if target in distances], default=self.unreachable_distance)
+
+    def push(self, sequence, gain, cost, distances={}):
+        heapq.heappush(self.frontier, (-self.priority(sequence, gain, cost, distances), next(self.order), gain, cost, distances,
+                                       sequence))
+
+    # history keeps changing after a sequence is queued, so a stale priority is refreshed when it reaches the top and the
+    # sequence is queued again if it no longer belongs there
+    def pop(self):
+        while len(self.frontier):
+            _, order, gain, cost, distances, sequence = heapq.heappop(self.frontier)
+            priority = self.priority(sequence, gain, cost, distances)
+            if len(self.frontier) and priority < -self.frontier[0][0]:
+                heapq.heappush(self.frontier, (-priority, order, gain, cost, distances, sequence))
+                continue
+            return sequence
+        return None
+
+    def record(self, funcName, productive):
+        history = self.expansions.setdefault(funcName, [0, 0])
+        history[0] += 1
+        if productive:
+            history[1] += 1
+
+    def outOfTime(self):
+        return self.budget is not None and time.time() - self.start >= self.budget
+
+    def exhausted(self, evaluated):
+        if self.outOfTime():
+            return True
+        return self.exec_budget is not None and evaluated >= self.exec_budget
+
+    def snapshotDue(self):
+        if not self.snapshot_interval or time.time() - self.lastSnapshot < self.snapshot_interval:
+            return False
+        self.lastSnapshot = time.time()
+        return True
+
+    def checkpointState(self):
+        return {"frontier": self.frontier, "expansions": self.expansions, "elapsed": time.time() - self.start,
+                "reached": self.reached}
+
+    # the budget keeps counting from where the checkpointed campaign left off
+    def restoreCheckpoint(self, state):
+        self.frontier = state["frontier"]
+        heapq.heapify(self.frontier)
+        self.expansions = state["expansions"]
+        self.reached = state["reached"]
+        self.start = time.time() - state["elapsed"]
+        self.order = itertools.count(max((entry[1] for entry in self.frontier), default=-1) + 1)
+
+
+'''Campaign state saved to checkpoint.gz in the output directory as a zlib-compressed pickle, so an interrupted campaign can be
+resumed with --resume. A checkpoint is written to a temporary file first and renamed into place, so the previous one
+survives a crash while the next one is being written. The final state --incremental builds on is stored the same way'''
+
+
+class Checkpoint:
+    version = 2
+
+    def __init__(self, output_dir, interval=None, name="checkpoint.gz"):
+        self.path = f"{output_dir}/{name}"
+        self.interval = interval
+        self.lastSave = time.time()
+
+    def due(self):
+        return bool(self.interval) and time.time() - self.lastSave >= self.interval
+
+    def save(self, state):
+        data = zlib.compress(pickle.dumps({"version": Checkpoint.version, "state": state}, pickle.HIGHEST_PROTOCOL))
+        with open(f"{self.path}.tmp", "wb") as checkpointFile:
+            checkpointFile.write(data)
+            checkpointFile.flush()
+            os.fsync(checkpointFile.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+        self.lastSave = time.time()
+
+    # returns None if there is no usable checkpoint
+    def load(self):
+        try:
+            with open(self.path, "rb") as checkpointFile:
+                saved = pickle.loads(zlib.decompress(checkpointFile.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+        if saved.get("version") != Checkpoint.version:
+            return None
+        return saved["state"]
+
+
 class CompileHarness:
     def __init__(self, input_dir, output_dir, functions, hardcodedVars, includes, read_from_buffer, debug, compatibility,
-                 allow_stderr, target_func, execute_static_version, allow_lincov, add_define_to_harness):
+                 allow_stderr, target_func, execute_static_version, allow_lincov, add_define_to_harness, jobs=1, batch_showmap=False, compile_cache=None, coverage_cache=False, seed_store=None, staged_oracle=False,
+                 persistent=False, fuse=1, parameterize=False, exec_timeout=None, compile_timeout=None, exec_rss=None,
+                 coverage_engine="showmap", campaign_queue=None, pipeline_depth=0):
         # constructor arguments
         self.input_dir = input_dir
         self.output_dir = output_dir
@@ -999,6 +1883,15 @@ class CompileHarness:
         self.execute_static_version = execute_static_version
         self.allow_lincov = allow_lincov
         self.add_define_to_harness = add_define_to_harness
+        self.jobs = max(1, jobs)
+        self.batch_showmap = batch_showmap
+        self.staged_oracle = staged_oracle
+        self.persistent = persistent
+        self.fuse = max(1, fuse)
+        self.parameterize = parameterize
+        self.exec_timeout = exec_timeout
+        self.compile_timeout = compile_timeout
+        self.campaign_queue = campaign_queue
 
         # initializing other useful data
         self.successfulSequences = []
@@ -1008,7 +1901,7 @@ class CompileHarness:
         self.currIterSequences = {}
         self.failed = 0
         self.maxTuplesCaptured = 0
-        self.globalBitmap = set()
+        self.globalBitmap = 0
         self.func_targets = 0
         self.targetSequences = []
 
@@ -1019,185 +1912,1097 @@ class CompileHarness:
         self.failedComp = 0
         self.failedCrash = 0
         self.failedCov = 0
+        self.failedHang = 0
+        self.pruned = 0  # candidates rejected by a failed prefix without being compiled
+        self.evaluated = 0  # candidates actually compiled and executed, what --exec_budget counts
+        self.scheduler = None  # the campaign's Scheduler, whose budget every candidate is checked against
+        # counters are bumped from worker threads when candidates are evaluated concurrently
+        self.statLock = threading.Lock()
+
+        # per-seed history the staged oracle uses to pick the seeds it screens candidates on
+        self.screen_valid = 2
+        self.screen_invalid = 1
+        self.validSeedScores = {}
+        self.invalidSeedScores = {}
+
+        # without a fixed --exec_timeout a seed may take exec_timeout_factor times its median observed execution time, within
+        # the floor and ceiling. Seeds that hang quarantine_strikes different harnesses are dropped from the campaign
+        self.exec_timeout_floor = 1.0
+        self.exec_timeout_ceiling = 60.0
+        self.exec_timeout_factor = 20
+        self.execTimes = {}
+        self.quarantine_strikes = 3
+        self.seedStrikes = {}
+        self.quarantined = set()
+        # with --minimize_seeds, the (store name, seed) pairs left out of the corpus the campaign runs on. The full corpus
+        # is only used again to validate the final harnesses
+        self.seedsMinimized = False
+        self.excludedSeeds = set()
+
+        # the memory cap is enforced by the sanitizer runtime. afl-showmap insists on abort_on_error and symbolize being set
+        # in custom ASAN_OPTIONS, so its defaults are used when none are given
+        self.limitEnv = {}
+        if exec_rss:
+            asan_options = os.environ.get("ASAN_OPTIONS", self.sanitizerDefaults["ASAN_OPTIONS"])
+            self.limitEnv["ASAN_OPTIONS"] = f"{asan_options}:hard_rss_limit_mb={exec_rss}"
+        # opened for appending so that a resumed campaign keeps the logs it had written so far
         if debug:
-            open(f"{self.output_dir}/debug-info/log_successful.txt", "w")
-            open(f"{self.output_dir}/debug-info/log_failed.txt", "w")
-            open(f"{self.output_dir}/debug-info/log_setup_routines.txt", "w")
-
-    def checkSequence(self, sequence):
+            open(f"{self.output_dir}/debug-info/log_successful.txt", "a")
+            open(f"{self.output_dir}/debug-info/log_failed.txt", "a")
+            open(f"{self.output_dir}/debug-info/log_setup_routines.txt", "a")
+
+        # the serial path keeps using gen/, workers get private scratch directories. Each one executes harnesses on its own seed
+        # store, kept next to it or under --seed_store (e.g. a tmpfs mount)
+        self.workspaces = queue.Queue()
+        self.allWorkspaces = []
+        self.pool = None
+        for i in range(0, self.jobs):
+            gen_dir = f"{self.output_dir}/gen" if self.jobs == 1 else f"{self.output_dir}/gen/worker{i}"
+            seed_root = gen_dir
+            if seed_store:
+                seed_root = seed_store if self.jobs == 1 else f"{seed_store}/worker{i}"
+            os.makedirs(gen_dir, exist_ok=True)
+            workspace = Workspace(gen_dir, SeedStore(f"{self.input_dir}/seeds_valid", f"{seed_root}/seeds_valid"),
+                                  SeedStore(f"{self.input_dir}/seeds_invalid", f"{seed_root}/seeds_invalid"))
+            self.allWorkspaces.append(workspace)
+            self.workspaces.put(workspace)
+        if self.jobs > 1:
+            self.pool = ThreadPoolExecutor(max_workers=self.jobs)
+
+        # with a pipeline, up to pipeline_depth candidates are generated ahead of the one whose result is merged next, and
+        # evaluated while generation goes on. Fused, parameterized and queued evaluation need whole batches
+        self.pipeline_depth = max(0, pipeline_depth)
+        if self.pipeline_depth and (self.fuse > 1 or self.parameterize or self.campaign_queue is not None):
+            print("WARNING: --pipeline_depth has no effect together with --fuse, --parameterize or --queue, candidates are evaluated in batches")
+            self.pipeline_depth = 0
+        self.pipelinePool = None
+        if self.pipeline_depth:
+            self.pipelinePool = self.pool if self.pool is not None else ThreadPoolExecutor(max_workers=1)
+
+        # resolving the Makefile recipes we rely on up front, anything that can't be resolved keeps going through make
+        self.recipes = {}
+        targets = ["harness", "showmap"]
+        if self.execute_static_version:
+            targets += ["harness_static", "showmap_static"]
+        if self.batch_showmap:
+            targets.append("showmap_batch")
+        for target in targets:
+            self.recipes[target] = Recipe.expand(self.input_dir, target)
+            if self.recipes[target] is None:
+                print(f"WARNING: Could not resolve the {target} Makefile recipe to a single command, falling back to invoking make")
+
+        # afl-cmin mode (-Z) is what marks crashing seeds in a batch run, so batches are only trusted from afl-showmap itself
+        if self.batch_showmap:
+            recipe = self.recipes["showmap_batch"]
+            if recipe is not None and os.path.basename(recipe.argv[0]) == "afl-showmap":
+                if "-Z" not in recipe.argv:
+                    recipe.argv.insert(1, "-Z")
+            else:
+                print("WARNING: --batch_showmap needs a showmap_batch recipe that resolves to an afl-showmap command to tell crashing seeds apart, falling back to per-seed runs")
+                self.batch_showmap = False
+
+        # the shm engine runs the command after the showmap recipe's "--" itself, so it needs that recipe resolved
+        self.shm_coverage = False
+        if coverage_engine == "shm":
+            recipe = self.recipes["showmap"]
+            if recipe is not None and "--" in recipe.argv[:-1]:
+                self.shm_coverage = True
+            else:
+                print("WARNING: The shm coverage engine needs a showmap recipe of the form afl-showmap ... -- <harness command>, falling back to afl-showmap")
+
+        # cache entries are keyed on the resolved compile command, so targets that go through make are never cached
+        self.compile_cache = CompileCache(compile_cache) if compile_cache else None
+        self.coverage_cache = CoverageCache(f"{self.output_dir}/coverage.db") if coverage_cache else None
+        self.libraryFingerprints = {}
+        self.crashes = CrashDatabase(self.output_dir)
+        self.failedPrefixes = FailedPrefixes()
+        self.badArguments = {}  # function name -> {(argument index, value)} choices the compiler rejected
+        for prefix, (signature, seed) in self.crashes.prefixes.items():
+            self.failedPrefixes.addKeys(prefix.split("\n"), "crash", f"known crash {signature} on file: {seed}")
+
+    # compiles source already written to out/harness.c, reusing a cached binary or compiler error for identical inputs
+    def compileTarget(self, target, out, source):
+        key = None
+        if self.compile_cache is not None and self.recipes.get(target) is not None:
+            key = self.compile_cache.key(self.recipes[target], source)
+            if (cached := self.compile_cache.lookup(key, f"{out}/harness.out")) is not None:
+                return cached
+        try:
+            proc = self.runTarget(target, out, text=True, timeout=self.compile_timeout)
+        except subprocess.TimeoutExpired:
+            return 1, self.compileTimeoutMessage.format(self.compile_timeout)
+        if key is not None:
+            self.compile_cache.store(key, proc.returncode, proc.stderr, f"{out}/harness.out")
+        return proc.returncode, proc.stderr
+
+    # runs a Makefile target for the given scratch directory, directly from its resolved recipe when possible
+    def runTarget(self, target, out, seed=None, seeds=None, extra_env={}, text=False, timeout=None):
+        values = {"OUT": str(out)}
+        if seed is not None:
+            values["SEED"] = seed
+        if seeds is not None:
+            values["SEEDS"] = seeds
+        recipe = self.recipes.get(target)
+        if recipe is not None:
+            argv, env = recipe.command(values)
+            run_env = os.environ.copy()
+            run_env["PWD"] = self.input_dir
+            run_env.update(env)
+            run_env.update(extra_env)
+            try:
+                return self.runProcess(argv, text, timeout, cwd=self.input_dir, env=run_env)
+            except OSError:
+                pass
+        variables = " ".join(f"{name}={value}" for name, value in list(extra_env.items()) + list(values.items()))
+        return self.runProcess(f"cd {self.input_dir} && {variables} make {target}", text, timeout, shell=True)
+
+    compileTimeoutMessage = "compilation timed out after {} seconds\n"
+    budgetMessage = "not evaluated, the harnessing budget is exhausted\n"
+
+    # candidates are checked against the budget one by one, so that neither a large expansion nor the setup phase overruns it.
+    # With count, the candidates about to be evaluated are counted against --exec_budget too
+    def budgetExhausted(self, count=0):
+        if self.scheduler is None:
+            return False
+        return self.scheduler.outOfTime() if count is None else self.scheduler.exhausted(self.evaluated + count)
+
+    # sanitizer settings afl-showmap would otherwise have applied, so sanitizer reports end in a signal as they do under AFL
+    sanitizerDefaults = {"ASAN_OPTIONS": "abort_on_error=1:detect_leaks=0:malloc_context_size=0:symbolize=0:allocator_may_return_null=1:detect_odr_violation=0:handle_segv=0:handle_sigbus=0:handle_abort=0:handle_sigfpe=0:handle_sigill=0",
+                         "UBSAN_OPTIONS": "halt_on_error=1:abort_on_error=1:malloc_context_size=0:allocator_may_return_null=1:symbolize=0:handle_segv=0:handle_sigbus=0:handle_abort=0:handle_sigfpe=0:handle_sigill=0"}
+    shm_map_size = 1 << 21
+
+    # runs the harness command from the showmap recipe directly against the workspace's shared-memory map. Mirrors
+    # afl-showmap's verdict: a harness killed by a signal counts as a crash (2), any exit status does not.
+    # returns (returncode, stdout, stderr, bitmap)
+    def runDirect(self, workspace, seed, timeout, extra_env):
+        if workspace.collector is None:
+            workspace.collector = ShmCoverage(self.shm_map_size)
+        workspace.collector.clear()
+        argv, env = self.recipes["showmap"].command({"OUT": str(workspace.gen_dir), "SEED": seed})
+        argv = argv[argv.index("--") + 1:]
+        run_env = os.environ.copy()
+        for name, value in self.sanitizerDefaults.items():
+            run_env.setdefault(name, value)
+        run_env["PWD"] = self.input_dir
+        run_env.update(env)
+        run_env.update(extra_env)
+        run_env["__AFL_SHM_ID"] = str(workspace.collector.id)
+        run_env["AFL_MAP_SIZE"] = str(self.shm_map_size)
+        proc = self.runProcess(argv, False, timeout, cwd=self.input_dir, env=run_env)
+        if proc.returncode < 0:
+            return 2, proc.stdout + f"\n+++ Harness killed by signal {-proc.returncode} +++\n".encode(), proc.stderr, None
+        return 0, proc.stdout, proc.stderr, self.bitmapFromMap(workspace.collector.read())
+
+    def closeCollectors(self):
+        for workspace in self.allWorkspaces:
+            if workspace.collector is not None:
+                workspace.collector.close()
+
+    # runs a command in its own process group, so a timeout takes down everything it spawned (make, afl-showmap, the harness)
+    # before subprocess.TimeoutExpired is raised
+    def runProcess(self, command, text, timeout, **options):
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text, start_new_session=True, **options)
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.communicate()
+            raise
+        return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+
+    def execTimeout(self, store, seed):
+        if self.exec_timeout:
+            return self.exec_timeout
+        with self.statLock:
+            times = list(self.execTimes.get((store.original_dir, seed), []))
+        if not times:
+            return self.exec_timeout_ceiling
+        return min(self.exec_timeout_ceiling, max(self.exec_timeout_floor, self.exec_timeout_factor * statistics.median(times)))
+
+    def recordExecTime(self, store, seed, elapsed):
+        with self.statLock:
+            self.execTimes.setdefault((store.original_dir, seed), deque(maxlen=50)).append(elapsed)
+
+    # counts a hang against the seed and quarantines it once it has hung enough harnesses, as long as the oracle is left
+    # with two valid seeds to compare and an invalid one
+    def recordHang(self, store, seed):
+        with self.statLock:
+            key = (store.original_dir, seed)
+            self.seedStrikes[key] = self.seedStrikes.get(key, 0) + 1
+            if self.seedStrikes[key] < self.quarantine_strikes or key in self.quarantined:
+                return
+            remaining = len([s for s in store.seeds if (store.original_dir, s) not in self.quarantined])
+            if remaining <= (2 if store.original_dir.endswith("seeds_valid") else 1):
+                return
+            self.quarantined.add(key)
+        print(f"WARNING: Quarantined seed {seed} after it hung {self.quarantine_strikes} harnesses")
+
+    # quarantined seeds are only removed from a workspace's stores once the workspace is free, never under a running harness
+    def applyQuarantine(self, workspace):
+        with self.statLock:
+            quarantined = list(self.quarantined)
+            excluded = list(self.excludedSeeds)
+        for store in [workspace.seeds_valid, workspace.seeds_invalid]:
+            for original_dir, seed in quarantined:
+                if original_dir == store.original_dir:
+                    store.quarantine(seed)
+            for name, seed in excluded:
+                if name == os.path.basename(store.original_dir):
+                    store.quarantine(seed)
+
+    # runs a compiled setup routine over the full corpus, returning the coverage of every valid and every invalid seed
+    def profileSeeds(self, sequence):
+        workspace = self.workspaces.get()
+        self.applyQuarantine(workspace)
+        try:
+            currentHarness = open(f"{workspace.gen_dir}/harness.c", "w")
+            currentHarness.write(sequence.cCode)
+            currentHarness.close()
+            returncode, stderr = self.compileTarget("harness", workspace.gen_dir, sequence.cCode)
+            if returncode:
+                return {}, {}
+            profiles = []
+            for store, filter_stderr in [(workspace.seeds_valid, True), (workspace.seeds_invalid, False)]:
+                profiles.append({result.seed: result.bitmap for result in self.runSeeds(workspace, store, filter_stderr)
+                                 if not result.hung and not result.returncode and result.bitmap is not None})
+            return profiles[0], profiles[1]
+        finally:
+            self.workspaces.put(workspace)
+
+    # picks the seeds the rest of the campaign runs on from what the setup routines reach on the full corpus. Valid seeds
+    # are kept until they cover every edge any valid seed reached under each routine, plus a pair of seeds whose coverage
+    # differs by more than 5 edges wherever the full corpus had one. Invalid seeds are kept until, for every routine where
+    # one existed, an invalid seed missing coverage the valid seeds reached is left
+    def minimizeSeeds(self, sequences):
+        if self.seedsMinimized:
+            return
+        self.seedsMinimized = True
+        profiles = [profile for profile in map(self.profileSeeds, sequences) if len(profile[0])]
+        if not len(profiles):
+            print("WARNING: No setup routine could be profiled on the seeds, keeping the full corpus")
+            return
+        valid_store, invalid_store = self.allWorkspaces[0].seeds_valid, self.allWorkspaces[0].seeds_invalid
+        valid = self.selectValidSeeds([valid for valid, _ in profiles], valid_store.seeds)
+        invalid = self.selectInvalidSeeds(profiles, invalid_store.seeds)
+        with self.statLock:
+            self.excludedSeeds = set((os.path.basename(store.original_dir), seed) for store, kept in [(valid_store, valid), (invalid_store, invalid)]
+                                     for seed in store.seeds if seed not in kept)
+        if self.campaign_queue is not None:
+            self.campaign_queue.publish("excludedSeeds", self.excludedSeeds)
+        print(f"Minimized the seed corpus to {len(valid)}/{len(valid_store.seeds)} valid and {len(invalid)}/{len(invalid_store.seeds)} invalid seeds")
+
+    def selectValidSeeds(self, profiles, seeds):
+        # every routine's coverage gets its own range of bits, so one greedy cover preserves what each routine reached
+        width = max(bitmap.bit_length() for profile in profiles for bitmap in profile.values()) + 1
+        features = {seed: sum(profile.get(seed, 0) << (index * width) for index, profile in enumerate(profiles)) for seed in seeds}
+        selected = []
+        covered = 0
+        while True:
+            gains = {seed: (features[seed] & ~covered).bit_count() for seed in seeds if seed not in selected}
+            if not len(gains) or max(gains.values()) == 0:
+                break
+            seed = max(gains, key=gains.get)
+            selected.append(seed)
+            covered |= features[seed]
+        for profile in profiles:
+            differs = lambda a, b: (profile.get(a, 0) ^ profile.get(b, 0)).bit_count() > 5
+            if any(differs(a, b) for a, b in itertools.combinations(selected, 2)):
+                continue
+            # a pair sharing a seed with the selection only costs one more seed
+            pair = next(((a, b) for a in selected for b in seeds if differs(a, b)), None) or \
+                next(((a, b) for a, b in itertools.combinations(seeds, 2) if differs(a, b)), None)
+            if pair is not None:
+                selected += [seed for seed in pair if seed not in selected]
+        for seed in sorted(seeds, key=lambda seed: -features[seed].bit_count()):
+            if len(selected) >= self.screen_valid:
+                break
+            if seed not in selected:
+                selected.append(seed)
+        return selected
+
+    def selectInvalidSeeds(self, profiles, seeds):
+        witnesses = []
+        for valid, invalid in profiles:
+            totalBitmap = 0
+            for bitmap in valid.values():
+                totalBitmap |= bitmap
+            witnesses.append(set(seed for seed, bitmap in invalid.items() if totalBitmap & ~bitmap))
+        selected = []
+        while True:
+            open_witnesses = [witness for witness in witnesses if len(witness) and not witness.intersection(selected)]
+            if not len(open_witnesses):
+                break
+            selected.append(max(seeds, key=lambda seed: len([witness for witness in open_witnesses if seed in witness])))
+        for seed in seeds:
+            if len(selected) >= self.screen_invalid:
+                break
+            if seed not in selected:
+                selected.append(seed)
+        return selected
+
+    # re-checks the given harnesses on the full corpus once the campaign is over, returning those that still pass the oracle
+    # with their coverage over every seed. Per-seed coverage is measured afresh, so constant coverage increases are not
+    # judged again
+    def validateSequences(self, sequences):
+        if not len(self.excludedSeeds):
+            return sequences
+        print(f"Validating {len(sequences)} harness(es) on the full seed corpus")
+        with self.statLock:
+            self.excludedSeeds = set()
+        for workspace in self.allWorkspaces:
+            workspace.seeds_valid.readmit()
+            workspace.seeds_invalid.readmit()
+        for sequence in sequences:
+            sequence.seedCov = {}
+        validated = []
+        for sequence, result in zip(sequences, self.evaluateSequences(sequences)):
+            if type(result) == int:
+                sequence.bitmap = result
+                validated.append(sequence)
+            else:
+                self.updateFailedFiles(f"failed validation on the full seed corpus: {result}", sequence.cCode)
+        if len(validated) < len(sequences):
+            print(f"WARNING: {len(sequences) - len(validated)} harness(es) failed validation on the full seed corpus and were dropped")
+        return validated
+
+    # everything the campaign has learned so far. Per-workspace state is left out, seed stores are repopulated on resume and
+    # quarantined seeds are dropped from them again before their first use
+    def checkpointState(self):
+        with self.statLock:
+            return {"globalBitmap": self.globalBitmap, "successfulSequences": self.successfulSequences,
+                    "routineSequences": self.routineSequences, "targetSequences": self.targetSequences,
+                    "success": self.success, "func_targets": self.func_targets, "maxTuplesCaptured": self.maxTuplesCaptured,
+                    "elapsed": time.time() - self.currTime, "minute": self.minute, "totalFunctions": self.totalFunctions,
+                    "failedComp": self.failedComp, "failedCrash": self.failedCrash, "failedCov": self.failedCov,
+                    "failedHang": self.failedHang, "pruned": self.pruned, "evaluated": self.evaluated, "validSeedScores": self.validSeedScores,
+                    "invalidSeedScores": self.invalidSeedScores, "execTimes": self.execTimes, "seedStrikes": self.seedStrikes,
+                    "quarantined": self.quarantined, "failedPrefixes": self.failedPrefixes.root, "badArguments": self.badArguments,
+                    "seedsMinimized": self.seedsMinimized, "excludedSeeds": self.excludedSeeds}
+
+    def restoreCheckpoint(self, state):
+        state = dict(state)
+        self.currTime = time.time() - state.pop("elapsed")
+        self.failedPrefixes.root = state.pop("failedPrefixes")
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def removeSeedStores(self):
+        for workspace in self.allWorkspaces:
+            workspace.seeds_valid.remove()
+            workspace.seeds_invalid.remove()
+
+    def renderHarness(self, sequence):
         newHarness = ConvertToC(sequence, self.includes, self.hardcodedVars, self.functions, self.read_from_buffer,
-                                self.compatibility, self.add_define_to_harness)
-        currentHarness = open(f"{self.output_dir}/gen/harness.c", "w")
-        convertedHarness = str(newHarness.Convert())
-        sequence.cCode = convertedHarness
-        currentHarness.write(convertedHarness)
-        currentHarness.close()
-
-        #stat tracking
+                                self.compatibility, self.add_define_to_harness, self.persistent, self.parameterize)
+        code = str(newHarness.Convert())
+        sequence.cTemplate = None
+        sequence.slotValues = newHarness.slotValues
+        if newHarness.slotValues:
+            sequence.cTemplate = code
+            code = re.sub(r"__OGHARN_SLOT_(\d+)__", lambda slot: newHarness.slotValues[int(slot.group(1))], code)
+        sequence.cCode = code
+
+    def logStats(self):
         newTime = time.time()
         if((newTime - self.currTime)/60 > self.minute):
             statFile = open(f"{self.output_dir}/debug-info/log_stats", "a")
-            statFile.write(f"{self.minute}, {self.success + self.failedComp + self.failedCov + self.failedCrash}, {self.success}, {self.failedComp}, {self.failedCov}, {self.failedCrash}, {len(self.globalBitmap)}, {len(self.totalFunctions)}\n")
+            statFile.write(f"{self.minute}, {self.success + self.failedComp + self.failedCov + self.failedCrash + self.failedHang}, {self.success}, {self.failedComp}, {self.failedCov}, {self.failedCrash}, {self.failedHang}, {self.globalBitmap.bit_count()}, {len(self.totalFunctions)}, {self.pruned}\n")
             statFile.close()
             self.minute+=1
-        retval = self.compileHarness(sequence)
-        return retval
 
-    # there are some cases where the behavior of the library under test differs depending on if it is compiled statically or dynamically. This functionality just compiles the harness statically and checks if it crashes on any inputs
-    def compileHarnessStatic(self, sequence):
-        proc = subprocess.run(f"cd {self.input_dir} && OUT={self.output_dir}/gen make harness_static", stderr=subprocess.PIPE, stdout=subprocess.PIPE,
-                              text=True, shell=True)
-        subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-        if not proc.returncode:
-            seeds = os.listdir(f"{self.input_dir}/seeds_validcp")
-            invalidSeeds = os.listdir(f"{self.input_dir}/seeds_invalidcp")
-            for seed in seeds:
-                try:
-                    proc = subprocess.run(f"cd {self.input_dir} && OUT={self.output_dir}/gen SEED={self.input_dir}/seeds_validcp/{seed} make showmap_static",
-                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True)
-                    subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-                    shutil.copytree(f"{self.input_dir}/seeds_valid", f"{self.input_dir}/seeds_validcp", dirs_exist_ok=True)
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return proc.returncode, f"Static Execution: crashed on file: {seed} err - {proc.stdout}\n"
-                except UnicodeDecodeError:
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return proc.returncode, f"Static Execution: crashed on file: {seed} err - {proc.stdout}\n"
-                except subprocess.CalledProcessError:
-                    # catch exception where we terminate OGHarn while a subprocess is running
-                    continue
-            for seed in invalidSeeds:
-                try:
-                    proc = subprocess.run(
-                        f"cd {self.input_dir} && OUT={self.output_dir}/gen SEED={self.input_dir}/seeds_invalidcp/{seed} make showmap_static",
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True)
-                    subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-                    shutil.copytree(f"{self.input_dir}/seeds_invalid", f"{self.input_dir}/seeds_invalidcp",
-                                    dirs_exist_ok=True)
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return proc.returncode, f"Static Execution: crashed on file: {seed} err- {proc.stdout}\n"
-                except UnicodeDecodeError:
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return proc.returncode, f"Static Execution: crashed on file: {seed} err - {proc.stdout}\n"
-                    continue
-                except subprocess.CalledProcessError:
-                    # catch exception where we terminate OGHarn while a subprocess is running
+    # compiles and executes an already rendered harness in whichever workspace is free
+    def evaluate(self, sequence):
+        if self.budgetExhausted(None):
+            return self.budgetMessage
+        workspace = self.workspaces.get()
+        self.applyQuarantine(workspace)
+        try:
+            currentHarness = open(f"{workspace.gen_dir}/harness.c", "w")
+            currentHarness.write(sequence.cCode)
+            currentHarness.close()
+            return self.compileHarness(sequence, workspace)
+        finally:
+            self.workspaces.put(workspace)
+
+    def checkSequence(self, sequence):
+        self.renderHarness(sequence)
+        #stat tracking
+        self.logStats()
+        if (known := self.knownFailure(sequence)) is not None:
+            return known
+        if self.budgetExhausted():
+            return self.budgetMessage
+        self.evaluated += 1
+        return self.evaluate(sequence)
+
+    # candidates starting with a call sequence that already failed to compile or crashed are rejected without being compiled.
+    # They are counted apart from the failures of candidates that were actually evaluated
+    def knownFailure(self, sequence):
+        if (entry := self.failedPrefixes.match(sequence.sequenceMembers)) is None:
+            return None
+        detail = entry[1]
+        with self.statLock:
+            self.pruned += 1
+        return f"extends a call sequence that already failed: {detail}\n"
+
+    # a compile that timed out may just have hit a load spike, so only real compiler errors mark the sequence as failed
+    def compileFailure(self, sequence, stderr, static=False):
+        if stderr != self.compileTimeoutMessage.format(self.compile_timeout):
+            self.failedPrefixes.add(sequence.sequenceMembers, "compile", "compilation error")
+            self.attributeDiagnostics(sequence, stderr)
+        if static:
+            return "Static Compilation: " + stderr
+        with self.statLock:
+            self.failedComp += 1
+        return stderr
+
+    # maps clang errors back to the call argument they point at, through the line and column of the generated call, and
+    # blacklists that (function, argument index, value) choice. Undeclared identifiers depend on the rest of the sequence
+    # rather than on the choice itself, so they are left alone
+    def attributeDiagnostics(self, sequence, stderr):
+        lines = sequence.cCode.split("\n")
+        calls = {}
+        start = 0
+        for member in sequence.sequenceMembers:
+            callname = member.name[:member.name.index("overload")] if "overload" in member.name else member.name
+            call = f"{callname}({', '.join(arg.value for arg in member.args)})"
+            for lineno in range(start, len(lines)):
+                if call in lines[lineno]:
+                    calls[lineno + 1] = (member, lines[lineno].index(call) + len(callname) + 1)
+                    start = lineno + 1
+                    break
+        for match in re.finditer(r"harness\.c:(\d+):(\d+): error: ([^\n]*)", stderr):
+            line, column, message = int(match.group(1)), int(match.group(2)) - 1, match.group(3)
+            if line not in calls or "undeclared" in message:
+                continue
+            member, offset = calls[line]
+            for argindex, arg in enumerate(member.args):
+                if offset <= column < offset + len(arg.value):
+                    with self.statLock:
+                        self.badArguments.setdefault(member.name, set()).add((argindex, arg.value))
+                    break
+                offset += len(arg.value) + 2
+
+    # fatal signals are left to AFL during normal runs, so a SEGV has no sanitizer report. Such crashes are reproduced once with
+    # the sanitizers handling them, for a stack to sign the crash with
+    def crashFailure(self, sequence, workspace, store, result, message, target="showmap"):
+        report = result.report
+        if not len(CrashDatabase.parse(report, result.stdout)[1]):
+            report = self.reproduceCrash(workspace, store, result.seed, target) or report
+        signature = self.crashes.record(sequence, f"{store.original_dir}/{result.seed}", report, result.stdout)
+        self.failedPrefixes.add(sequence.sequenceMembers, "crash", f"known crash {signature} on file: {result.seed}")
+        with self.statLock:
+            self.failedCrash += 1
+        return f"{message}crash signature: {signature}\n"
+
+    # returns the harness's stderr on the seed with the sanitizers handling SEGV, SIGBUS, SIGFPE and SIGILL themselves
+    def reproduceCrash(self, workspace, store, seed, target):
+        options = self.limitEnv.get("ASAN_OPTIONS", os.environ.get("ASAN_OPTIONS", self.sanitizerDefaults["ASAN_OPTIONS"]))
+        env = {**workspace.env(), **self.limitEnv,
+               "ASAN_OPTIONS": f"{options}:handle_segv=1:handle_sigbus=1:handle_sigfpe=1:handle_sigill=1"}
+        try:
+            if target == "showmap" and self.shm_coverage:
+                stderr = self.runDirect(workspace, f"{store.dir}/{seed}", self.execTimeout(store, seed), env)[2]
+            else:
+                stderr = self.runTarget(target, workspace.gen_dir, seed=f"{store.dir}/{seed}", extra_env=env,
+                                        timeout=self.execTimeout(store, seed)).stderr
+        except subprocess.TimeoutExpired:
+            return ""
+        finally:
+            store.restore([seed])
+        return stderr.decode(errors="replace")
+
+    # evaluates a batch of candidates, concurrently if workers are available. Results are returned in the order of the
+    # given sequences so they can be merged exactly as if every candidate had been checked one after another
+    def checkSequences(self, sequences):
+        # rendering happens up front on the main thread so that variable names drawn from random stay reproducible
+        for sequence in sequences:
+            self.renderHarness(sequence)
+            self.logStats()
+        results = [None] * len(sequences)
+        pending = []
+        for index, sequence in enumerate(sequences):
+            if (known := self.knownFailure(sequence)) is not None:
+                results[index] = known
+            elif self.budgetExhausted(len(pending)):
+                results[index] = self.budgetMessage
+            else:
+                pending.append(index)
+        self.evaluated += len(pending)
+        evaluate = self.evaluateSequences if self.campaign_queue is None else self.distributeSequences
+        for index, result in zip(pending, evaluate([sequences[index] for index in pending])):
+            results[index] = result
+        return results
+
+    # checks candidates as they come, yielding each candidate with its result in the order they were given. With a pipeline
+    # the candidates may come from a generator, which is only advanced while fewer than pipeline_depth of them are in flight
+    def streamSequences(self, sequences):
+        if not self.pipeline_depth:
+            sequences = list(sequences)
+            yield from zip(sequences, self.checkSequences(sequences))
+            return
+        pending = deque()
+        for sequence in sequences:
+            if self.budgetExhausted():
+                break
+            # rendering stays on this thread so that variable names drawn from random stay reproducible
+            self.renderHarness(sequence)
+            self.logStats()
+            if (known := self.knownFailure(sequence)) is not None:
+                pending.append((sequence, None, known))
+            else:
+                self.evaluated += 1
+                pending.append((sequence, self.pipelinePool.submit(self.evaluate, sequence), None))
+            while len(pending) and (len(pending) >= self.pipeline_depth or pending[0][1] is None or pending[0][1].done()):
+                sequence, future, known = pending.popleft()
+                yield sequence, known if future is None else future.result()
+        while len(pending):
+            sequence, future, known = pending.popleft()
+            yield sequence, known if future is None else future.result()
+
+    def evaluateSequences(self, sequences):
+        if (self.fuse > 1 or self.parameterize) and len(sequences) > 1:
+            units = self.batchCandidates(sequences)
+            batches = [[sequences[index] for index in unit] for unit in units]
+            if self.pool is None or len(batches) < 2:
+                batchResults = [self.evaluateFused(batch) for batch in batches]
+            else:
+                batchResults = self.pool.map(self.evaluateFused, batches)
+            results = [None] * len(sequences)
+            for unit, unitResults in zip(units, batchResults):
+                for index, result in zip(unit, unitResults):
+                    results[index] = result
+            return results
+        if self.pool is None or len(sequences) < 2:
+            return [self.evaluate(sequence) for sequence in sequences]
+        return list(self.pool.map(self.evaluate, sequences))
+
+    # what evaluating a candidate records on it. Queued candidates are evaluated as copies, so these travel back with each result
+    evaluatedFields = ("seedCov", "uninteresting_setup", "bitmap")
+
+    def evaluatedState(self, sequence):
+        return {field: getattr(sequence, field) for field in self.evaluatedFields}
+
+    # hands the candidates to the campaign queue and waits for their results. Whatever no worker has claimed yet is evaluated
+    # here, so the campaign keeps going with no workers attached
+    def distributeSequences(self, sequences):
+        ids = self.campaign_queue.submit(sequences)
+        submitted = dict(zip(ids, sequences))
+        results = {}
+        while len(results) < len(ids):
+            for id, outcome in self.campaign_queue.collect([id for id in ids if id not in results]).items():
+                if outcome is None:
+                    outcome = (self.evaluateSequences([submitted[id]])[0], self.evaluatedState(submitted[id]), None)
+                result, state, report = outcome
+                results[id] = result
+                for field, value in state.items():
+                    setattr(submitted[id], field, value)
+                if report is not None:
+                    self.mergeWorkerReport(report)
+            if len(results) == len(ids):
+                break
+            claimed = self.campaign_queue.claim("coordinator", self.jobs * self.fuse)
+            if not len(claimed):
+                time.sleep(self.campaign_queue.poll_interval)
+                continue
+            for (id, sequence), result in zip(claimed, self.evaluateSequences([sequence for _, sequence in claimed])):
+                self.campaign_queue.complete(id, (result, self.evaluatedState(sequence), None))
+        return [results[id] for id in ids]
+
+    # runs as a queue worker until the coordinator closes the queue. Along with every batch's results, the worker reports the
+    # failure counters, failed prefixes and rejected arguments the batch added, for the coordinator to merge
+    def serveQueue(self, worker):
+        self.failedPrefixes.log = []
+        while True:
+            claimed = self.campaign_queue.claim(worker, self.jobs * self.fuse)
+            if not len(claimed):
+                if self.campaign_queue.setting("closed"):
+                    return
+                time.sleep(self.campaign_queue.poll_interval)
+                continue
+            with self.statLock:
+                self.excludedSeeds = self.campaign_queue.setting("excludedSeeds") or set()
+            before = (self.failedComp, self.failedCrash, self.failedHang, self.failedCov, self.pruned)
+            badArguments = {name: set(values) for name, values in self.badArguments.items()}
+            results = self.evaluateSequences([sequence for _, sequence in claimed])
+            report = {"failedComp": self.failedComp - before[0], "failedCrash": self.failedCrash - before[1],
+                      "failedHang": self.failedHang - before[2], "failedCov": self.failedCov - before[3],
+                      "pruned": self.pruned - before[4],
+                      "prefixes": self.failedPrefixes.log,
+                      "badArguments": {name: values - badArguments.get(name, set()) for name, values in self.badArguments.items()}}
+            self.failedPrefixes.log = []
+            for index, ((id, sequence), result) in enumerate(zip(claimed, results)):
+                self.campaign_queue.complete(id, (result, self.evaluatedState(sequence), report if index == 0 else None))
+
+    def mergeWorkerReport(self, report):
+        with self.statLock:
+            self.failedComp += report["failedComp"]
+            self.failedCrash += report["failedCrash"]
+            self.failedHang += report["failedHang"]
+            self.failedCov += report["failedCov"]
+            self.pruned += report["pruned"]
+            for name, values in report["badArguments"].items():
+                self.badArguments.setdefault(name, set()).update(values)
+        for keys, kind, detail in report["prefixes"]:
+            self.failedPrefixes.addKeys(keys, kind, detail)
+
+    # splits candidates into the units compiled together. Candidates sharing a parameterized skeleton form their own units,
+    # the rest are fused in batches. Units are kept small enough that every worker gets one
+    def batchCandidates(self, sequences):
+        size = max(1, min(self.fuse, -(-len(sequences) // self.jobs)))
+        units = []
+        singles = []
+        groups = {}
+        for index, sequence in enumerate(sequences):
+            if self.parameterize and sequence.cTemplate is not None:
+                groups.setdefault(sequence.cTemplate, []).append(index)
+            else:
+                singles.append(index)
+        for group in groups.values():
+            if len(group) < 2:
+                singles += group
+                continue
+            chunk = -(-len(group) // self.jobs)
+            units += [group[i:i + chunk] for i in range(0, len(group), chunk)]
+        singles.sort()
+        units += [singles[i:i + size] for i in range(0, len(singles), size)]
+        return units
+
+    def harnessHeader(self, sequence):
+        header = ConvertToC(sequence, self.includes, self.hardcodedVars, self.functions, self.read_from_buffer,
+                            self.compatibility, self.add_define_to_harness, self.persistent)
+        header.write_includes()
+        return str(header.file)
+
+    # builds one binary for candidates that only differ in their literal arguments. The slots read the candidate's row of a
+    # table selected by $OGHARN_CANDIDATE. Returns None if the candidates don't share a skeleton
+    def parameterizeHarnesses(self, sequences):
+        template = sequences[0].cTemplate
+        header = self.harnessHeader(sequences[0])
+        if template is None or not template.startswith(header) or any(sequence.cTemplate != template for sequence in sequences):
+            return None
+        rows = ",\n".join("\t{" + ", ".join(sequence.slotValues) + "}" for sequence in sequences)
+        table = f'''static const long long ogharn_slots[][{len(sequences[0].slotValues)}] = {{
+{rows}
+}};
+
+static int ogharn_candidate(void)
+{{
+\tconst char *candidate = getenv("OGHARN_CANDIDATE");
+\treturn candidate ? atoi(candidate) : 0;
+}}
+'''
+        body = re.sub(r"__OGHARN_SLOT_(\d+)__", r"ogharn_slots[ogharn_candidate()][\1]", template[len(header):])
+        return header + table + body
+
+    # joins already rendered candidates into one translation unit. Each candidate's main becomes ogharn_candidateN and a
+    # dispatcher main runs the one selected by $OGHARN_CANDIDATE. Returns None if a candidate can't be split from the shared header
+    def fuseHarnesses(self, sequences):
+        header = self.harnessHeader(sequences[0])
+        source = [header]
+        declared = set()
+        for index, sequence in enumerate(sequences):
+            if not sequence.cCode.startswith(header):
+                return None
+            candidate = sequence.cCode[len(header):]
+            # function pointer definitions shared by several candidates are only emitted once, anything still clashing
+            # fails the compile and gets the batch bisected
+            for fp in sequence.functionPointerDeclarations:
+                definition = str(sequence.functionPointerDeclarations[fp])
+                if definition in declared:
+                    candidate = candidate.replace(definition, "", 1)
+                declared.add(definition)
+            candidate, renamed = re.subn(r"\bint\s+main\s*\(", f"int ogharn_candidate{index}(", candidate, count=1)
+            if not renamed:
+                return None
+            source.append(candidate)
+        cases = "".join(f"\tcase {index}:\n\t\treturn ogharn_candidate{index}(argc, argv);\n" for index in range(1, len(sequences)))
+        source.append(f'''
+int main(int argc, char *argv[])
+{{
+\tconst char *candidate = getenv("OGHARN_CANDIDATE");
+\tswitch(candidate ? atoi(candidate) : 0) {{
+{cases}\tdefault:
+\t\treturn ogharn_candidate0(argc, argv);
+\t}}
+}}
+''')
+        return "\n".join(source)
+
+    # compiles the candidates at indices into one binary for target and runs each one through the matching oracle. A batch
+    # that fails to compile is bisected until every candidate the compiler rejects is isolated, so each one is still reported
+    # with its own compiler error. Returns the indices of the candidates that passed
+    def evaluateBatch(self, target, sequences, indices, workspace, results):
+        if not indices:
+            return []
+        source = sequences[indices[0]].cCode
+        if len(indices) > 1:
+            batch = [sequences[i] for i in indices]
+            source = self.parameterizeHarnesses(batch) if self.parameterize else None
+            if source is None:
+                source = self.fuseHarnesses(batch)
+        returncode = 1
+        if source is not None:
+            currentHarness = open(f"{workspace.gen_dir}/harness.c", "w")
+            currentHarness.write(source)
+            currentHarness.close()
+            returncode, stderr = self.compileTarget(target, workspace.gen_dir, source)
+        if returncode:
+            if len(indices) > 1:
+                middle = len(indices) // 2
+                return (self.evaluateBatch(target, sequences, indices[:middle], workspace, results) +
+                        self.evaluateBatch(target, sequences, indices[middle:], workspace, results))
+            results[indices[0]] = self.compileFailure(sequences[indices[0]], stderr, target == "harness_static")
+            return []
+        passed = []
+        for slot, index in enumerate(indices):
+            workspace.candidate = slot if len(indices) > 1 else None
+            if target == "harness_static":
+                exit_code, result = self.executeHarnessStatic(sequences[index], workspace)
+                if exit_code:
+                    results[index] = result
                     continue
-            return 0, ""
+            else:
+                results[index] = self.executeHarness(sequences[index], workspace)
+            passed.append(index)
+        workspace.candidate = None
+        return passed
+
+    # evaluates already rendered candidates through fused binaries in whichever workspace is free, one result per candidate
+    def evaluateFused(self, sequences):
+        if self.budgetExhausted(None):
+            return [self.budgetMessage] * len(sequences)
+        workspace = self.workspaces.get()
+        self.applyQuarantine(workspace)
+        try:
+            results = [None] * len(sequences)
+            indices = list(range(len(sequences)))
+            if self.execute_static_version:
+                indices = self.evaluateBatch("harness_static", sequences, indices, workspace, results)
+            self.evaluateBatch("harness", sequences, indices, workspace, results)
+            return results
+        finally:
+            self.workspaces.put(workspace)
+
+    # runs the harness in the workspace on every seed of a store, one afl-showmap invocation per seed. The seed is restored after
+    # every execution in case the harness modified the file it was handed
+    def executeSeeds(self, workspace, store, target, filter_stderr, coverage=True, seeds=None):
+        binary = self.binaryDigest(workspace)
+        for seed in (store.seeds if seeds is None else seeds):
+            key = self.coverageKey(workspace, binary, store, seed, target)
+            if key is not None and (cached := self.coverage_cache.lookup(*key)) is not None:
+                returncode, stdout, stderr_state, bitmap, report = cached
+                yield self.filterResult(seed, returncode, stdout, stderr_state, bitmap, filter_stderr, report)
+                continue
+            start = time.time()
+            bitmap = None
+            try:
+                if target == "showmap" and self.shm_coverage:
+                    returncode, stdout, stderr, bitmap = self.runDirect(workspace, f"{store.dir}/{seed}", self.execTimeout(store, seed),
+                                                                        {**workspace.env(), **self.limitEnv})
+                    proc = subprocess.CompletedProcess(target, returncode, stdout, stderr)
+                else:
+                    proc = self.runTarget(target, workspace.gen_dir, seed=f"{store.dir}/{seed}", extra_env={**workspace.env(), **self.limitEnv},
+                                          timeout=self.execTimeout(store, seed))
+            except subprocess.TimeoutExpired:
+                store.restore([seed])
+                self.recordHang(store, seed)
+                yield SeedResult(seed, None, "", None, hung=True)
+                continue
+            self.recordExecTime(store, seed, time.time() - start)
+            store.restore([seed])
+            mapfile = f"{workspace.gen_dir}/tempfile" if coverage and bitmap is None else None
+            yield self.seedResult(seed, proc.returncode, proc.stdout, proc.stderr, mapfile, filter_stderr, key, bitmap)
+
+    # runs the harness on a whole seed directory with a single afl-showmap invocation (-i/-o batch mode) and reads the per-seed
+    # maps back. afl-showmap's exit status only reflects the last input, so crashes are told apart per seed by the empty map
+    # afl-cmin mode (-Z) leaves for a crashing or hanging input, and those seeds are re-run on their own. The forkserver does
+    # not separate the harness's stderr per seed, so any stderr sends the whole directory through the per-seed path.
+    # when seeds is given the whole directory still runs but only those seeds' results are returned
+    def executeSeedsBatch(self, workspace, store, filter_stderr, seeds=None):
+        seeds = store.seeds if seeds is None else seeds
+        binary = self.binaryDigest(workspace)
+        keys = {seed: self.coverageKey(workspace, binary, store, seed, "showmap") for seed in seeds}
+        if binary is not None and all(self.coverage_cache.lookup(*keys[seed]) is not None for seed in seeds):
+            yield from self.executeSeeds(workspace, store, "showmap", filter_stderr, seeds=seeds)
+            return
+        map_dir = f"{workspace.gen_dir}/maps"
+        if os.path.exists(map_dir):
+            shutil.rmtree(map_dir)
+        os.makedirs(map_dir)
+        # AFL_DEBUG_CHILD lets the harness's stderr through, which the oracle needs to reject seeds that hit error paths
+        try:
+            proc = self.runTarget("showmap_batch", workspace.gen_dir, seeds=store.dir, extra_env={"AFL_DEBUG_CHILD": "1", **workspace.env(), **self.limitEnv},
+                                  timeout=sum(self.execTimeout(store, seed) for seed in store.seeds))
+        except subprocess.TimeoutExpired:
+            # running seed by seed pins the hang on the seed responsible
+            store.restore()
+            yield from self.executeSeeds(workspace, store, "showmap", filter_stderr, seeds=seeds)
+            return
+        store.restore()
+        batch_usable = not proc.returncode and not len(proc.stderr) and all(os.path.exists(f"{map_dir}/{seed}") for seed in seeds)
+        if not batch_usable:
+            yield from self.executeSeeds(workspace, store, "showmap", filter_stderr, seeds=seeds)
+            return
+        for seed in seeds:
+            if not os.path.getsize(f"{map_dir}/{seed}"):
+                yield from self.executeSeeds(workspace, store, "showmap", filter_stderr, seeds=[seed])
+                continue
+            # without any stderr in the whole batch every other seed is known to have run cleanly, which is what the cache records
+            yield self.seedResult(seed, 0, b"", b"", f"{map_dir}/{seed}", filter_stderr, keys[seed])
+
+    def seedResult(self, seed, returncode, stdout, stderr, mapfile, filter_stderr, key=None, bitmap=None):
+        stdout = stdout.decode(errors="replace")
+        try:
+            stderr_state = "dirty" if len(stderr.decode()) else "clean"
+        except UnicodeDecodeError:
+            stderr_state = "undecodable"
+        if returncode:
+            bitmap = None
+        elif mapfile is not None:
+            bitmap = self.getBitmap(mapfile)
+        report = stderr.decode(errors="replace") if returncode else ""
+        if key is not None:
+            self.coverage_cache.store(*key, returncode, stdout, stderr_state, bitmap, report)
+        return self.filterResult(seed, returncode, stdout, stderr_state, bitmap, filter_stderr, report)
+
+    def filterResult(self, seed, returncode, stdout, stderr_state, bitmap, filter_stderr, report=""):
+        if returncode:
+            return SeedResult(seed, returncode, stdout, None, report=report)
+        if stderr_state == "undecodable":
+            # If the standard error spits out some random bytes a decoding exception can occur. Valid seeds are only kept if we don't care about the standard error
+            keep = filter_stderr and self.allow_stderr
         else:
-            return 1, "Static Compilation: " + proc.stderr
-            
+            keep = not filter_stderr or stderr_state == "clean" or self.allow_stderr
+        return SeedResult(seed, returncode, stdout, bitmap if keep else None)
+
+    def binaryDigest(self, workspace):
+        if self.coverage_cache is None:
+            return None
+        return CoverageCache.digest(f"{workspace.gen_dir}/harness.out")
+
+    # a harness binary loads the library under test at run time, so cached executions are only valid for the same build of it
+    def coverageKey(self, workspace, binary, store, seed, target):
+        if binary is None or (libraries := self.libraryFingerprint(target)) is None:
+            return None
+        return binary, store.digests[seed], f"{workspace.tag(target)}@{libraries}"
+
+    # digest of the libraries an execution may load: those in the run recipe's LD_LIBRARY_PATH and those the harness was linked
+    # against. None if the run goes through make, whose environment can't be known
+    def libraryFingerprint(self, target):
+        if target not in self.libraryFingerprints:
+            recipe = self.recipes.get(target)
+            if recipe is None:
+                self.libraryFingerprints[target] = None
+                return None
+            paths = []
+            for lib_dir in recipe.env.get("LD_LIBRARY_PATH", os.environ.get("LD_LIBRARY_PATH", "")).split(":"):
+                lib_dir = os.path.join(self.input_dir, lib_dir) if lib_dir else None
+                if lib_dir and os.path.isdir(lib_dir):
+                    paths += [f"{lib_dir}/{lib}" for lib in sorted(os.listdir(lib_dir)) if CompileCache.isLibrary(lib)]
+            if (compile_recipe := self.recipes.get("harness_static" if target == "showmap_static" else "harness")) is not None:
+                paths += CompileCache.libraries(compile_recipe.argv)
+            self.libraryFingerprints[target] = hashlib.sha256(CompileCache.statFingerprint(paths).encode()).hexdigest()[:16]
+        return self.libraryFingerprints[target]
+
+    # batch mode always runs the whole seed directory, so it is skipped for the handful of seeds the staged oracle screens on
+    def runSeeds(self, workspace, store, filter_stderr, seeds=None, batch=True):
+        if self.batch_showmap and batch and not self.shm_coverage:
+            return self.executeSeedsBatch(workspace, store, filter_stderr, seeds)
+        return self.executeSeeds(workspace, store, "showmap", filter_stderr, seeds=seeds)
+
+    # picks the screening seeds: the valid seeds that most often showed coverage distinct from the other valid seeds (or crashed)
+    # and the invalid seed that most often reached coverage the valid seeds did not. without any history yet the first seeds are used
+    def screeningSeeds(self, workspace):
+        with self.statLock:
+            valid_scores = dict(self.validSeedScores)
+            invalid_scores = dict(self.invalidSeedScores)
+        valid = sorted(workspace.seeds_valid.seeds, key=lambda seed: -valid_scores.get(seed, 0))[:self.screen_valid]
+        invalid = sorted(workspace.seeds_invalid.seeds, key=lambda seed: -invalid_scores.get(seed, 0))[:self.screen_invalid]
+        return valid, invalid
+
+    def recordScreeningHistory(self, scores, seeds):
+        with self.statLock:
+            for seed in seeds:
+                scores[seed] = scores.get(seed, 0) + 1
+
+    # first stage of the staged oracle. runs the candidate on the few screening seeds and rejects it as soon as they show
+    # a crash, no unique coverage between the valid seeds, or an invalid seed covering everything the valid seeds reached.
+    # the coverage verdicts are an approximation of the full oracle. candidates that pass are judged on the full corpus,
+    # reusing the screening results. returns (failure message, valid results, invalid results)
+    def screenHarness(self, sequence, workspace):
+        valid_seeds, invalid_seeds = self.screeningSeeds(workspace)
+        valid_results, invalid_results = {}, {}
+        for result in self.runSeeds(workspace, workspace.seeds_valid, True, valid_seeds, batch=False):
+            if result.hung:
+                return self.hangFailure(sequence, result.seed), {}, {}
+            if result.returncode:
+                self.recordScreeningHistory(self.validSeedScores, [result.seed])
+                return self.crashFailure(sequence, workspace, workspace.seeds_valid, result, f"crashed on file: {result.seed} err - {result.stdout}\n"), {}, {}
+            valid_results[result.seed] = result
+        maps = [result.bitmap for result in valid_results.values() if result.bitmap is not None]
+        if len(maps) > 1 and not any((maps[i] ^ maps[j]).bit_count() > 5 for i in range(len(maps)) for j in range(i + 1, len(maps))):
+            with self.statLock:
+                self.failedCov += 1
+            return "no unique coverage observed between screening seeds\n", {}, {}
+        screenBitmap = 0
+        for bmap in maps:
+            screenBitmap |= bmap
+        for result in self.runSeeds(workspace, workspace.seeds_invalid, False, invalid_seeds, batch=False):
+            if result.hung:
+                return self.hangFailure(sequence, result.seed), {}, {}
+            if result.returncode:
+                self.recordScreeningHistory(self.invalidSeedScores, [result.seed])
+                return self.crashFailure(sequence, workspace, workspace.seeds_invalid, result, f"crashed on file: {result.seed} err- {result.stdout}\n"), {}, {}
+            if screenBitmap and result.bitmap is not None and not screenBitmap & ~result.bitmap:
+                with self.statLock:
+                    self.failedCov += 1
+                return "screening invalid seeds offer no coverage difference\n", {}, {}
+            invalid_results[result.seed] = result
+        return None, valid_results, invalid_results
+
+    # runs the remaining seeds of a store after the staged oracle's screening results
+    def stagedSeeds(self, workspace, store, filter_stderr, screened):
+        if not screened:
+            return self.runSeeds(workspace, store, filter_stderr)
+        remaining = [seed for seed in store.seeds if seed not in screened]
+        return itertools.chain(screened.values(), self.runSeeds(workspace, store, filter_stderr, remaining))
 
+    # there are some cases where the behavior of the library under test differs depending on if it is compiled statically or dynamically. This functionality just compiles the harness statically and checks if it crashes on any inputs
+    def compileHarnessStatic(self, sequence, workspace):
+        returncode, stderr = self.compileTarget("harness_static", workspace.gen_dir, sequence.cCode)
+        if not returncode:
+            return self.executeHarnessStatic(sequence, workspace)
+        else:
+            return 1, self.compileFailure(sequence, stderr, True)
 
-    def compileHarness(self, sequence):
+    # a harness that hangs on any seed is rejected, whichever seed it is. Like a compile timeout, a hang may just be the
+    # adaptive timeout meeting a load spike, so it doesn't mark the sequence as a failed prefix
+    def hangFailure(self, sequence, seed, prefix=""):
+        with self.statLock:
+            self.failedHang += 1
+        return f"{prefix}hang on file: {seed}\n"
+
+    def executeHarnessStatic(self, sequence, workspace):
+        for store, sep in [(workspace.seeds_valid, " "), (workspace.seeds_invalid, "")]:
+            for result in self.executeSeeds(workspace, store, "showmap_static", False, False):
+                if result.hung:
+                    return 1, self.hangFailure(sequence, result.seed, "Static Execution: ")
+                if result.returncode:
+                    return result.returncode, self.crashFailure(sequence, workspace, store, result, f"Static Execution: crashed on file: {result.seed} err{sep}- {result.stdout}\n", "showmap_static")
+        return 0, ""
+
+
+
+    def compileHarness(self, sequence, workspace):
         if self.execute_static_version:
-            exit_code, result = self.compileHarnessStatic(sequence)
+            exit_code, result = self.compileHarnessStatic(sequence, workspace)
             if exit_code:
                 return result
-        proc = subprocess.run(f"cd {self.input_dir} && OUT={self.output_dir}/gen make harness", stderr=subprocess.PIPE, stdout=subprocess.PIPE,
-                              text=True, shell=True)
-        subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-        if not proc.returncode:
-            totalBitmap = set()
-            seeds = os.listdir(f"{self.input_dir}/seeds_validcp")
-            invalidSeeds = os.listdir(f"{self.input_dir}/seeds_invalidcp")
-            seedMaps = []
-            unique_cov = False
-            const_increase_amount = -1
-            const_increase = True
-            for seed in seeds:
-                try:
-                    proc = subprocess.run(f"cd {self.input_dir} && OUT={self.output_dir}/gen SEED={self.input_dir}/seeds_validcp/{seed} make showmap",
-                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True)
-                    subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-                    shutil.copytree(f"{self.input_dir}/seeds_valid", f"{self.input_dir}/seeds_validcp", dirs_exist_ok=True)
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return f"crashed on file: {seed} err - {proc.stdout}\n"
-                    if (not len(proc.stderr)) or self.allow_stderr:
-                        currBitmap = self.getBitmap(open(f"{self.output_dir}/gen/tempfile", "r"))
-                        # only need to check if we're gaining unique coverage if no other seed inputs have demonstrated that.
-                        if seed in sequence.seedCov:
-                            if const_increase_amount < 0:
-                                const_increase_amount = len(currBitmap.difference(sequence.seedCov[seed]))
-                            if len(currBitmap.difference(sequence.seedCov[seed])) != const_increase_amount:
-                                const_increase = False
-                        sequence.seedCov[seed] = currBitmap
-                        if not unique_cov:
-                            unique_cov = unique_cov or any([len(currBitmap ^ bmap) > 5 for bmap in seedMaps])
-                            seedMaps.append(currBitmap)
-                        totalBitmap = totalBitmap.union(currBitmap)
-                except UnicodeDecodeError:
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return f"crashed on file: {seed} err - {proc.stdout}\n"
-                    # If the standard error spits out some random bytes a decoding exception can occur. If we don't care about the standard error then we leave this
-                    if self.allow_stderr:
-                        currBitmap = self.getBitmap(open(f"{self.output_dir}/gen/tempfile", "r"))
-                        if seed in sequence.seedCov:
-                            if const_increase_amount < 0:
-                                const_increase_amount = len(currBitmap.difference(sequence.seedCov[seed]))
-                            if len(currBitmap.difference(sequence.seedCov[seed])) != const_increase_amount:
-                                const_increase = False
-                        sequence.seedCov[seed] = currBitmap
-                        if not unique_cov:
-                            unique_cov = unique_cov or any([len(currBitmap ^ bmap) > 5 for bmap in seedMaps])
-                            seedMaps.append(currBitmap)
-                        totalBitmap = totalBitmap.union(currBitmap)
-                    shutil.copytree(f"{self.input_dir}/seeds_valid", f"{self.input_dir}/seeds_validcp", dirs_exist_ok=True)
-                    continue
-                except subprocess.CalledProcessError:
-                    # catch exception where we terminate OGHarn while a subprocess is running
-                    continue
-            if not unique_cov and sequence.setupLen:
+        returncode, stderr = self.compileTarget("harness", workspace.gen_dir, sequence.cCode)
+        if not returncode:
+            return self.executeHarness(sequence, workspace)
+        else:
+            return self.compileFailure(sequence, stderr)
+
+    # runs the compiled harness through the oracle, returning its coverage or why it was rejected
+    def executeHarness(self, sequence, workspace):
+        screened_valid, screened_invalid = {}, {}
+        if self.staged_oracle and sequence.setupLen:
+            failure, screened_valid, screened_invalid = self.screenHarness(sequence, workspace)
+            if failure:
+                return failure
+        validMaps = {}
+        totalBitmap = 0
+        seedMaps = []
+        unique_cov = False
+        const_increase_amount = -1
+        const_increase = True
+        for result in self.stagedSeeds(workspace, workspace.seeds_valid, True, screened_valid):
+            seed = result.seed
+            if result.hung:
+                return self.hangFailure(sequence, seed)
+            if result.returncode:
+                if self.staged_oracle:
+                    self.recordScreeningHistory(self.validSeedScores, [seed])
+                return self.crashFailure(sequence, workspace, workspace.seeds_valid, result, f"crashed on file: {seed} err - {result.stdout}\n")
+            if result.bitmap is None:
+                continue
+            currBitmap = result.bitmap
+            # only need to check if we're gaining unique coverage if no other seed inputs have demonstrated that.
+            if seed in sequence.seedCov:
+                if const_increase_amount < 0:
+                    const_increase_amount = (currBitmap & ~sequence.seedCov[seed]).bit_count()
+                if (currBitmap & ~sequence.seedCov[seed]).bit_count() != const_increase_amount:
+                    const_increase = False
+            sequence.seedCov[seed] = currBitmap
+            validMaps[seed] = currBitmap
+            if not unique_cov:
+                unique_cov = unique_cov or any([(currBitmap ^ bmap).bit_count() > 5 for bmap in seedMaps])
+                seedMaps.append(currBitmap)
+            totalBitmap |= currBitmap
+        if self.staged_oracle:
+            self.recordScreeningHistory(self.validSeedScores, [seed for seed, bmap in validMaps.items() if any((bmap ^ other).bit_count() > 5 for other in validMaps.values())])
+        if not unique_cov and sequence.setupLen:
+            with self.statLock:
                 self.failedCov += 1
-                return "no unique coverage observed between seeds\n"
-            if (const_increase and sequence.setupLen) and not self.allow_lincov:
+            return "no unique coverage observed between seeds\n"
+        # without the parent's per-seed coverage to compare against, no constant increase can be observed
+        if (const_increase and const_increase_amount >= 0 and sequence.setupLen) and not self.allow_lincov:
+            with self.statLock:
                 self.failedCov += 1
-                return "constant coverage increase between seeds\n"
-            uninteresting_cov = True
-            for seed in invalidSeeds:
-                try:
-                    proc = subprocess.run(
-                        f"cd {self.input_dir} && OUT={self.output_dir}/gen SEED={self.input_dir}/seeds_invalidcp/{seed} make showmap",
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True)
-                    subprocess.run(f"cd {os.getcwd()}", text=True, shell=True)
-                    shutil.copytree(f"{self.input_dir}/seeds_invalid", f"{self.input_dir}/seeds_invalidcp",
-                                    dirs_exist_ok=True)
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return f"crashed on file: {seed} err- {proc.stdout}\n"
-                    currBitmap = self.getBitmap(open(f"{self.output_dir}/gen/tempfile", "r"))
-                    if not len(totalBitmap.intersection(currBitmap)) == len(totalBitmap):
-                        uninteresting_cov = False
-                except UnicodeDecodeError:
-                    if proc.returncode:
-                        self.failedCrash += 1
-                        return f"crashed on file: {seed} err - {proc.stdout}\n"
-                    shutil.copytree(f"{self.input_dir}/seeds_invalid", f"{self.input_dir}/seeds_invalidcp",
-                                    dirs_exist_ok=True)
-                    continue
-                except subprocess.CalledProcessError:
-                    # catch exception where we terminate OGHarn while a subprocess is running
-                    continue
-            if uninteresting_cov:
-                if sequence.setupLen:
+            return "constant coverage increase between seeds\n"
+        uninteresting_cov = True
+        for result in self.stagedSeeds(workspace, workspace.seeds_invalid, False, screened_invalid):
+            if result.hung:
+                return self.hangFailure(sequence, result.seed)
+            if result.returncode:
+                if self.staged_oracle:
+                    self.recordScreeningHistory(self.invalidSeedScores, [result.seed])
+                return self.crashFailure(sequence, workspace, workspace.seeds_invalid, result, f"crashed on file: {result.seed} err- {result.stdout}\n")
+            if result.bitmap is None:
+                continue
+            currBitmap = result.bitmap
+            if totalBitmap & ~currBitmap:
+                uninteresting_cov = False
+                if self.staged_oracle:
+                    self.recordScreeningHistory(self.invalidSeedScores, [result.seed])
+        if uninteresting_cov:
+            if sequence.setupLen:
+                with self.statLock:
                     self.failedCov += 1
-                    return "invalid seeds offer no coverage difference\n"
-            sequence.uninteresting_setup = uninteresting_cov or (not unique_cov)
-            return totalBitmap
-        else:
-            self.failedComp += 1
-            return proc.stderr
-
-    def getBitmap(self, file):
-        bmap = set()
-        for line in file:
-            bmap.add(line.split(":")[0])
-        return bmap
+                return "invalid seeds offer no coverage difference\n"
+        sequence.uninteresting_setup = uninteresting_cov or (not unique_cov)
+        return totalBitmap
+
+    # coverage is kept as a Python int used as a bitset, bit i set when edge i was hit. Both afl-showmap's text maps (id:count
+    # per line) and its binary maps (-b, one byte per edge) are read
+    mapBits = bytes([0x30] + [0x31] * 255)
+
+    def getBitmap(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data:
+            return 0
+        if not data.translate(None, b"0123456789:\r\n"):
+            # afl-cmin mode (-Z) writes each edge as its id followed by a three digit hit count, without a colon
+            edges = [int(line.split(b":")[0]) if b":" in line else int(line) // 1000 for line in data.split()]
+            if not edges:
+                return 0
+            bits = bytearray(b"0" * (max(edges) + 1))
+            for edge in edges:
+                bits[edge] = 0x31
+            return int(bits[::-1], 2)
+        return self.bitmapFromMap(data)
+
+    def bitmapFromMap(self, data):
+        data = data.rstrip(b"\0")
+        if not data:
+            return 0
+        return int(data.translate(self.mapBits)[::-1], 2)
 
     def updateFailedFiles(self, failure_message, cCode):
         self.failed += 1
@@ -4,15 +4,16 @@ import ogharn
 import random
 import multiplier as mx
 import os
-from engine import Sequence, SequenceMember, CheckCompatibility, literal_arg, function_pointer_arg, predefined_arg, define_new_val_arg, fuzz_buffer_arg, fuzz_struct_arg, multiplier_type
+from engine import ArgumentStats, Sequence, SequenceMember, CheckCompatibility, literal_arg, function_pointer_arg, predefined_arg, define_new_val_arg, fuzz_buffer_arg, fuzz_struct_arg, multiplier_type
 
 
 '''Builds the arguments for a function call in a sequence. This only initialized once at the beginning of the driver of the process.'''
 class Harness_Builder:
-    def __init__(self, functions, enums, macros, functionPointers, compatibility, compiler, target_function, arg_keys, fast_mode, allow_complex_aux_sequences):
+    def __init__(self, functions, enums, macros, functionPointers, compatibility, compiler, target_function, arg_keys, fast_mode, allow_complex_aux_sequences, explore_rate=1.0, integer_macros=frozenset()):
         self.functions = functions
         self.enums = enums
         self.macros = macros
+        self.integer_macros = integer_macros
         self.functionPointers = functionPointers
         self.compatibility = compatibility
         self.compiler = compiler
@@ -30,9 +31,23 @@ class Harness_Builder:
         self.current_setup_restrictions = 1
         self.last_called_func = ""
         self.current_dependency = None
+        self.argumentStats = ArgumentStats(explore_rate)
+
+    def checkpointState(self):
+        return {"auxiliary_functions": self.auxiliary_functions, "harnessed_funcs": self.harnessed_funcs,
+                "current_setup_restrictions": self.current_setup_restrictions, "argumentSlots": self.argumentStats.slots}
+
+    def restoreCheckpoint(self, state):
+        state = dict(state)
+        self.argumentStats.slots = state.pop("argumentSlots")
+        for name, value in state.items():
+            setattr(self, name, value)
 
     '''Constructs the possible arguments that can be passed into a function'''
     def buildArguments(self, sequence, func, restricted_args):
+        # nothing extending a call sequence that already failed to compile or crashed can succeed
+        if self.compiler.failedPrefixes.match(sequence.sequenceMembers) is not None:
+            return []
         if not len(restricted_args):
             self.last_called_func = sequence.sequenceMembers[-1].name
             self.current_dependency = func
@@ -55,7 +70,7 @@ class Harness_Builder:
                 possibleArgumentList[argindex] += self.checkFunctionValues(sequence.sequenceMembers, arg, argindex in restricted_args)
                 if arg.pointers and argindex not in restricted_args:
                     possibleArgumentList[argindex].append(literal_arg("NULL"))
-                macroList = self.checkMacros(arg)
+                macroList = self.checkMacros(arg, currFunction.name, argindex)
                 if macroList:
                     possibleArgumentList[argindex] += macroList
                     macros.append(argindex)
@@ -276,7 +291,7 @@ class Harness_Builder:
             if arg.pointers and argindex not in restricted_args and argindex != pointer_arg_num:
                 possibleArgumentList[argindex].append(literal_arg("NULL"))
             possibleArgumentList[argindex] += self.checkFunctionValues(sequence.sequenceMembers, arg, argindex in restricted_args)
-            macroList = self.checkMacros(arg)
+            macroList = self.checkMacros(arg, currFunction.name, argindex)
             if macroList:
                 possibleArgumentList[argindex] += macroList
                 macros.append(argindex)
@@ -319,7 +334,7 @@ class Harness_Builder:
             possibleArgumentList[argindex] += self.checkFunctionValues(sequence.sequenceMembers, arg, argindex in restricted_args)
             if arg.pointers and argindex not in restricted_args:
                 possibleArgumentList[argindex].append(literal_arg("NULL"))
-            macroList = self.checkMacros(arg)
+            macroList = self.checkMacros(arg, currFunction.name, argindex)
             if macroList:
                 possibleArgumentList[argindex] += macroList
                 macros.append(argindex)
@@ -382,7 +397,7 @@ class Harness_Builder:
             if arg.pointers and not argindex in restricted_args:
                 possibleArgumentList[argindex].append(literal_arg("NULL"))
             possibleArgumentList[argindex] += self.checkFunctionValues(sequence.sequenceMembers, arg, argindex in restricted_args)
-            macroList = self.checkMacros(arg)
+            macroList = self.checkMacros(arg, currFunction.name, argindex)
             if macroList:
                 possibleArgumentList[argindex] += macroList
                 macros.append(argindex)
@@ -476,21 +491,21 @@ class Harness_Builder:
                 arg_type = arg_type.base_type
             if arg_type in self.enums:
                 for enum_val in self.enums[arg_type]:
-                    enums.append(literal_arg(enum_val))
+                    enums.append(literal_arg(enum_val, integer=True))
         return enums
     
     '''Checks what macros be passed in as an argument'''
-    def checkMacros(self, currArg):
+    def checkMacros(self, currArg, funcName, argindex):
         retlist = None
         if not currArg.pointers:
             if len(self.macros):
                 retlist = []
                 if self.compatibility.check_builtin_type_compatibility(currArg, "INT", "dummy"):
-                    macros = random.choices(self.macros, k=10)
+                    macros = self.argumentStats.choose(funcName, argindex, self.macros, 10)
                     for m in macros:
-                        retlist.append(literal_arg(m))
+                        retlist.append(literal_arg(m, integer=m in self.integer_macros))
             elif self.compatibility.check_builtin_type_compatibility(currArg, "INT", "dummy"):
-                retlist = [literal_arg("0")]
+                retlist = [literal_arg("0", integer=True)]
         return retlist
 
     '''Looks for a relationship between the arguments of a function'''
@@ -547,42 +562,59 @@ class Harness_Builder:
     '''Builds the final sequences for the function call.'''
     def finalizePermutations(self, currFunc, sequence, possibleArguments, macros, argRelationships, priorityArg):
         heap = []
+        targetedFuncs = set(target for target in (self.target_function or []) if currFunc.name == target or currFunc.name.startswith(target + "overload"))
+        # argument choices the compiler already rejected for this function are never sampled again
+        badArguments = self.compiler.badArguments.get(currFunc.name, set())
+        if len(badArguments):
+            possibleArguments = [[arg for arg in possibleArguments[i] if (i, arg.value) not in badArguments] for i in range(0, len(possibleArguments))]
+        possibleArguments = self.canonicalizeArguments(currFunc, possibleArguments)
+        candidates = self.candidateSequences(currFunc, sequence, possibleArguments, macros, argRelationships, priorityArg,
+                                             badArguments, targetedFuncs)
+        # candidates are generated lazily, with --pipeline_depth only as fast as they can be compiled and executed
+        outcomes = ogharn.analyzeHarnesses(candidates, heap, self.compiler)
+        self.recordOutcomes(currFunc, outcomes, heap)
+        if len(heap):
+            self.harnessed_funcs.add(currFunc.name)
+        if currFunc.name in self.functions.auxiliaryFunctions:
+            return heap
+        return ogharn.getBestHarnesses(self.compiler, heap, float("inf"))
+
+    # the argument tuples to try for the function: every permutation, or 100 sampled ones if there are more, each followed
+    # by its macro substitutions the first time its non-macro arguments are seen
+    def argumentTuples(self, currFunc, sequence, possibleArguments, macros, argRelationships):
         totalPerms = 1
         macroCombinations = []
         if len(macros):
             macroCombinations = list(itertools.product(self.macroVals, repeat=len(macros)))
-        currentArgSequence = []
         non_injectable_choices = []
-        targetedFunc = self.target_function and (currFunc.name == self.target_function or currFunc.name.startswith(self.target_function + "overload"))
-
-
         for i in range(0, len(possibleArguments)):
             totalPerms *= len(possibleArguments[i])
 
         if totalPerms > 100:
+            sampled = set()
+            permutations = []
             for i in range(0, 100):
-                choices = [random.choice(sublist) for sublist in possibleArguments]
+                choices = [self.argumentStats.choose(currFunc.name, j, possibleArguments[j])[0] for j in range(0, len(possibleArguments))]
                 regenAttempts = 0
-                while choices in currentArgSequence and regenAttempts < 5:
-                    choices = [random.choice(sublist) for sublist in possibleArguments]
+                while self.argumentsKey(currFunc, choices) in sampled and regenAttempts < 5:
+                    choices = [self.argumentStats.choose(currFunc.name, j, possibleArguments[j])[0] for j in range(0, len(possibleArguments))]
                     regenAttempts += 1
-                currentArgSequence.append(choices)
-                non_injectable_args = [i for i in range(0, len(choices)) if i not in macros]
-                if not non_injectable_args in non_injectable_choices:
-                    currentArgSequence += self.check_macros(macroCombinations, currFunc, sequence, choices, macros,
-                                                        argRelationships)
-                    non_injectable_choices.append(non_injectable_args)
+                sampled.add(self.argumentsKey(currFunc, choices))
+                permutations.append(choices)
         else:
-            permutations = itertools.product(*possibleArguments)
-            for perm in permutations:
-                perm = list(perm)
-                currentArgSequence.append(perm)
-                non_injectable_args = [i for i in range(0, len(perm)) if i not in macros]
-                if not non_injectable_args in non_injectable_choices:
-                    currentArgSequence += self.check_macros(macroCombinations, currFunc, sequence, perm, macros,
-                                                            argRelationships)
-                    non_injectable_choices.append(non_injectable_args)
-        for arg in currentArgSequence:
+            permutations = (list(perm) for perm in itertools.product(*possibleArguments))
+        for perm in permutations:
+            yield perm
+            non_injectable_args = [i for i in range(0, len(perm)) if i not in macros]
+            if not non_injectable_args in non_injectable_choices:
+                yield from self.check_macros(macroCombinations, currFunc, sequence, perm, macros, argRelationships)
+                non_injectable_choices.append(non_injectable_args)
+
+    # yields the candidate sequences calling the function, skipping those that can already be told to fail or were tried
+    # this iteration
+    def candidateSequences(self, currFunc, sequence, possibleArguments, macros, argRelationships, priorityArg, badArguments, targetedFuncs):
+        generated = set()
+        for arg in self.argumentTuples(currFunc, sequence, possibleArguments, macros, argRelationships):
             if currFunc.name in self.arg_keys:
                 new_args = list(arg)
                 for param in self.arg_keys[currFunc.name]:
@@ -590,6 +622,10 @@ class Harness_Builder:
                     value = param["value"]
                     new_args[int(index)] = literal_arg(value)
                 arg = new_args
+            # macro substitutions and config overrides can reproduce a tuple that was already generated
+            if (key := self.argumentsKey(currFunc, arg)) in generated:
+                continue
+            generated.add(key)
             sequences = self.finalizeArguments(currFunc, arg, argRelationships, priorityArg, deepcopy(sequence), True)
             for seq in sequences:
                 # checking if fuzzData is in multiple argument slots, if it is, ignore it.
@@ -600,30 +636,84 @@ class Harness_Builder:
                         fuzzCount += 1
                 if fuzzCount > 1:
                     continue
-                if targetedFunc:
+                if any((i, latestMem.args[i].value) in badArguments for i in range(0, len(latestMem.args))):
+                    continue
+                if len(targetedFuncs):
                     seq.func_targeted = True
-                latestMem = seq.sequenceMembers[-1]
-                if currFunc.name in self.functions.auxiliaryFunctions:
-                    ogharn.analyzeHarness(seq, heap, self.compiler)
-                    if len(heap):
-                        self.harnessed_funcs.add(seq.sequenceMembers[-1].name)
-                    self.compiler.currIterSequences[str(seq.sequenceMembers)] = 1
-                elif str(seq.sequenceMembers) not in self.compiler.currIterSequences:
-                    ogharn.analyzeHarness(seq, heap, self.compiler)
-                    if len(heap):
-                        self.harnessed_funcs.add(seq.sequenceMembers[-1].name)
+                    seq.targets = seq.targets | targetedFuncs
+                if self.compiler.failedPrefixes.match(seq.sequenceMembers) is not None:
+                    continue
+                if currFunc.name in self.functions.auxiliaryFunctions or str(seq.sequenceMembers) not in self.compiler.currIterSequences:
                     self.compiler.currIterSequences[str(seq.sequenceMembers)] = 1
-        if currFunc.name in self.functions.auxiliaryFunctions:
-            return heap
-        return ogharn.getBestHarnesses(self.compiler, heap, float("inf"))
-    
+                    yield seq
+
+    # values that generate the same C for a slot are kept once, in the order they were first offered
+    def canonicalizeArguments(self, currFunc, possibleArguments):
+        canonical = []
+        for i in range(0, len(possibleArguments)):
+            seen = set()
+            values = []
+            for arg in possibleArguments[i]:
+                key = self.canonicalArgument(arg, currFunc.mult_args[i])
+                if key not in seen:
+                    seen.add(key)
+                    values.append(arg)
+            canonical.append(values)
+        return canonical
+
+    def argumentsKey(self, currFunc, args):
+        return tuple(self.canonicalArgument(args[i], currFunc.mult_args[i]) for i in range(0, len(args)))
+
+    # normalized form of an argument: integer literals in any base or suffix, redundant parentheses and, for pointers, the
+    # spellings of a null pointer compare equal. Values that come with a declaration are only equal if the declarations are
+    def canonicalArgument(self, arg, argType):
+        value = arg.value.strip()
+        while value.startswith("(") and value.endswith(")") and self.enclosed(value):
+            value = value[1:-1].strip()
+        if isinstance(arg, (define_new_val_arg, function_pointer_arg)):
+            return (type(arg).__name__, value, arg.definition)
+        try:
+            value = str(int(value.rstrip("uUlL"), 0))
+        except ValueError:
+            pass
+        if argType.pointers and value in ["0", "NULL", "(void*)0", "(void *)0", "nullptr"]:
+            value = "NULL"
+        return ("value", value, None)
+
+    # whether the outermost parentheses of value enclose all of it, unlike in "(a) + (b)"
+    @staticmethod
+    def enclosed(value):
+        depth = 0
+        for i in range(0, len(value)):
+            if value[i] == "(":
+                depth += 1
+            elif value[i] == ")":
+                depth -= 1
+                if depth == 0 and i < len(value) - 1:
+                    return False
+        return depth == 0
+
+    # feeds what became of each candidate back into the argument statistics sampling draws from
+    def recordOutcomes(self, currFunc, outcomes, heap):
+        kept = set(id(seq) for seq in heap)
+        for seq, check in outcomes:
+            if id(seq) in kept:
+                outcome = "coverage"
+            elif type(check) == int:
+                outcome = "clean"
+            elif (failure := self.compiler.failedPrefixes.match(seq.sequenceMembers)) is not None and failure[0] == "crash":
+                outcome = "crash"
+            else:
+                outcome = "failed"
+            self.argumentStats.record(currFunc.name, seq.sequenceMembers[-1].args, outcome)
+
     def replaceMacros(self, args, macroIndexes, macroVals):
         macroCount = 0
         args = list(args)
         for i in range(0, len(args)):
             if(macroCount < len(macroIndexes)):
                 if(i == macroIndexes[macroCount]):
-                    args[i] = literal_arg(str(macroVals[macroCount]))
+                    args[i] = literal_arg(str(macroVals[macroCount]), integer=True)
                     macroCount += 1
         return tuple(args)
 
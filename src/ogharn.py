@@ -107,46 +107,43 @@ def handle_interrupt(sig, frame):
     # sleeping for a sec to let any other subprocesses finish
     time.sleep(2)
     try:
-        exit_routine()
+        exit_routine(validate=False)
     # if an exit occurs before the compiler is defined, an exception occurs, we catch that
     except Exception as e:
         print(f"An exception occurred: {e}")
     os._exit(0)
 
 
-def exit_routine():
-    compiler.globalBitmap = set() # resetting bitmap for edge optimization
-    if not args.target_func:
-        if len(compiler.successfulSequences):
-            final_sequences = compiler.successfulSequences + compiler.currIterSuccesses
-        else:
-            final_sequences = compiler.routineSequences + compiler.currIterSuccesses
+# the final harnesses are validated on the full seed corpus, except from the interrupt handler, where the evaluation that was
+# interrupted may still hold a workspace
+def exit_routine(validate=True):
+    final_sequences = finalSequences()
+    if validate:
+        final_sequences = compiler.validateSequences(final_sequences)
+    elif len(compiler.excludedSeeds):
+        print("WARNING: The final harnesses were not validated on the full seed corpus")
+    if args.target_func and len(args.target_func) > 1:
+        # every target gets its own minimized corpus, a harness reaching several targets may be kept by each of them
+        bestSequences = []
+        totalBitmap = 0
+        for target in args.target_func:
+            compiler.globalBitmap = 0
+            bestTarget = getBestHarnesses(compiler, [seq for seq in final_sequences if target in seq.targets], float("inf"))
+            targetBitmap = writeHarnesses(bestTarget, f"{output_dir}/final-harnesses/{target}")
+            print(f"{target}: {len(bestTarget)} harness(es) capturing {targetBitmap.bit_count()} edges")
+            bestSequences += [seq for seq in bestTarget if seq not in bestSequences]
+            totalBitmap |= targetBitmap
+        compiler.globalBitmap = totalBitmap
+        harnessCount = len(bestSequences)
     else:
-        final_sequences = compiler.targetSequences + compiler.currIterSuccesses
-
-    bestSequences = getBestHarnesses(compiler, final_sequences, float("inf"))
-
-    if not os.path.exists(f"{output_dir}/final-harnesses/"):
-        os.mkdir(f"{output_dir}/final-harnesses/")
-    if not os.path.exists(f"{output_dir}/final-harnesses/bin"):
-        os.mkdir(f"{output_dir}/final-harnesses/bin")
-    if not os.path.exists(f"{output_dir}/final-harnesses/src"):
-        os.mkdir(f"{output_dir}/final-harnesses/src")
-    harnessCount = 0
-    for harness in bestSequences:
-        harnessCount += 1
-        currFile = open(f"{output_dir}/final-harnesses/src/harness{harnessCount}:{harness.effectiveness}-new-tuples.c", "w")
-        harnessFile = open(f"{output_dir}/gen/harness.c", "w")
-        currFile.write(harness.cCode)
-        harnessFile.write(harness.cCode)
-        currFile.close()
-        harnessFile.close()
-        #storing binaries
-        proc = subprocess.run(f"cd {input_dir} && OUT={output_dir}/gen make harness", stderr=subprocess.PIPE, stdout=subprocess.PIPE,
-                              text=True, shell=True)
-        subprocess.run(f"mv {output_dir}/gen/harness.out {output_dir}/final-harnesses/bin/harness{harnessCount}.out", text=True, shell=True)
-        compiler.globalBitmap = compiler.globalBitmap.union(harness.bitmap)
-    fstr = f"Total coverage captured between {harnessCount} files in {output_dir}/final-harnesses: {len(compiler.globalBitmap)}\n"
+        compiler.globalBitmap = 0 # resetting bitmap for edge optimization
+        bestSequences = getBestHarnesses(compiler, final_sequences, float("inf"))
+        compiler.globalBitmap = writeHarnesses(bestSequences, f"{output_dir}/final-harnesses")
+        harnessCount = len(bestSequences)
+    # what a later --incremental run against a rebuilt library starts from
+    engine.Checkpoint(f"{output_dir}/final-harnesses", name="campaign.gz").save({"signatures": functions.signatures(),
+        "routines": setup_routines, "harnesses": bestSequences, "setup_restrictions": argBuilder.current_setup_restrictions})
+    fstr = f"Total coverage captured between {harnessCount} files in {output_dir}/final-harnesses: {compiler.globalBitmap.bit_count()}\n"
     os.write(sys.stdout.fileno(), b"DONE!\n")
     os.write(sys.stdout.fileno(), bytes(fstr, 'utf-8'))
     if debug:
@@ -159,20 +156,70 @@ def exit_routine():
         for function in argBuilder.harnessed_funcs:
             harnessed_function_feedback.write(f"{function}\n")
 
-    if os.path.exists(f"{input_dir}/seeds_validcp"):
-        shutil.rmtree(f"{input_dir}/seeds_validcp")
-    if os.path.exists(f"{input_dir}/seeds_invalidcp"):
-        shutil.rmtree(f"{input_dir}/seeds_invalidcp")
+    compiler.removeSeedStores()
+    compiler.closeCollectors()
+    if compiler.campaign_queue is not None:
+        compiler.campaign_queue.close()
+
+# writes the sources and binaries of a minimized corpus to directory/src and directory/bin, returning its coverage
+def writeHarnesses(bestSequences, directory):
+    os.makedirs(f"{directory}/bin", exist_ok=True)
+    os.makedirs(f"{directory}/src", exist_ok=True)
+    bitmap = 0
+    harnessCount = 0
+    for harness in bestSequences:
+        harnessCount += 1
+        currFile = open(f"{directory}/src/harness{harnessCount}:{harness.effectiveness}-new-tuples.c", "w")
+        harnessFile = open(f"{output_dir}/gen/harness.c", "w")
+        currFile.write(harness.cCode)
+        harnessFile.write(harness.cCode)
+        currFile.close()
+        harnessFile.close()
+        #storing binaries
+        compiler.compileTarget("harness", f"{output_dir}/gen", harness.cCode)
+        subprocess.run(f"mv {output_dir}/gen/harness.out {directory}/bin/harness{harnessCount}.out", text=True, shell=True)
+        bitmap |= harness.bitmap
+    return bitmap
 
-def getBestHarnesses(compiler, heap, limit):
+
+def finalSequences():
+    if not args.target_func:
+        if len(compiler.successfulSequences):
+            return compiler.successfulSequences + compiler.currIterSuccesses
+        return compiler.routineSequences + compiler.currIterSuccesses
+    return compiler.targetSequences + compiler.currIterSuccesses
+
+
+# writes the sources of the corpus minimized so far to snapshot/, replacing the previous snapshot in one rename
+def writeSnapshot():
+    bestSequences = getBestHarnesses(compiler, finalSequences(), float("inf"), 0)
+    snapshot_dir = f"{output_dir}/snapshot"
+    if os.path.isdir(f"{snapshot_dir}.tmp"):
+        shutil.rmtree(f"{snapshot_dir}.tmp")
+    os.makedirs(f"{snapshot_dir}.tmp/src")
+    bitmap = 0
+    for harnessCount, harness in enumerate(bestSequences, 1):
+        currFile = open(f"{snapshot_dir}.tmp/src/harness{harnessCount}:{harness.effectiveness}-new-tuples.c", "w")
+        currFile.write(harness.cCode)
+        currFile.close()
+        bitmap |= harness.bitmap
+    statFile = open(f"{snapshot_dir}.tmp/stats", "w")
+    statFile.write(f"Seconds: {int(time.time() - scheduler.start)}\nCandidates: {compiler.evaluated}\nHarnesses: {len(bestSequences)}\nTotal Edges: {bitmap.bit_count()}\n")
+    statFile.close()
+    if os.path.isdir(snapshot_dir):
+        shutil.rmtree(snapshot_dir)
+    os.rename(f"{snapshot_dir}.tmp", snapshot_dir)
+
+
+def getBestHarnesses(compiler, heap, limit, base=None):
     harnessesToGenerate = []
-    currBitmap = compiler.globalBitmap.copy()
+    currBitmap = compiler.globalBitmap if base is None else base
     count = 0
     totalHeap = len(heap)
     while count < min(totalHeap, limit):
         diff_dict = {} # dict that maps diff/coverage gain to list of sequences
         for sequence in heap:
-            currDiff = len(sequence.bitmap.difference(currBitmap))
+            currDiff = (sequence.bitmap & ~currBitmap).bit_count()
             diff_dict.setdefault(currDiff, []).append(sequence)
         max_diff = max(diff_dict.keys())
         if max_diff > 0:
@@ -190,47 +237,223 @@ def getBestHarnesses(compiler, heap, limit):
                         break
             seq_to_add.effectiveness = max_diff
             harnessesToGenerate.append(seq_to_add)
-            currBitmap = currBitmap.union(seq_to_add.bitmap)
+            currBitmap |= seq_to_add.bitmap
         else:
             break
         count += 1
     return harnessesToGenerate
 
-def generateHarnesses(sequence, funcName):
-    global argBuilder
+# extends the given sequences best-first, always expanding the most promising queued sequence next, until the frontier
+# is empty or the campaign's budget runs out
+def generateHarnesses(sequences):
+    # the sequences harnessing starts from are what the seed corpus is minimized on, only the first time round
+    if args.minimize_seeds and len(sequences):
+        compiler.minimizeSeeds(sequences)
+    for sequence in sequences:
+        scheduleHarness(sequence)
+    if checkpoint.interval:
+        writeCheckpoint()
+    while len(scheduler.frontier):
+        if scheduler.exhausted(compiler.evaluated):
+            print("\nHarnessing budget exhausted, no further sequences will be extended")
+            return
+        expandHarness(scheduler.pop())
+        if scheduler.snapshotDue():
+            writeSnapshot()
+        if checkpoint.due():
+            writeCheckpoint()
+
+
+# checkpoints are only taken between two expansions, when no candidate is in flight
+def writeCheckpoint():
+    checkpoint.save({"phase": phase, "init_sequences": init_sequences, "phase_init_sequences": phase_init_sequences,
+                     "setup_routines": setup_routines, "incremental_targets": incremental_targets,
+                     "compiler": compiler.checkpointState(), "builder": argBuilder.checkpointState(),
+                     "scheduler": scheduler.checkpointState(), "random": random.getstate()})
+
+
+# continues a checkpointed campaign with the sequences that were still queued, the setup routines it had found are not
+# searched for again
+def resume_harnessing(state):
+    global phase, phase_init_sequences, init_sequences, setup_routines, incremental_targets
+    phase = state["phase"]
+    init_sequences = state["init_sequences"]
+    phase_init_sequences = state["phase_init_sequences"]
+    setup_routines = state["setup_routines"]
+    incremental_targets = state["incremental_targets"]
+    compiler.restoreCheckpoint(state["compiler"])
+    argBuilder.restoreCheckpoint(state["builder"])
+    scheduler.restoreCheckpoint(state["scheduler"])
+    random.setstate(state["random"])
+    print(f"Resuming from checkpoint with {len(scheduler.frontier)} queued sequence(s)")
+    generateHarnesses([])
+    if phase == "target" and not scheduler.exhausted(compiler.evaluated):
+        print("Beginning to explore other setup routines")
+        begin_harnessing(argBuilder, functions, compiler, phase_init_sequences)
+        return
+    finish_harnessing()
+
+
+# harnesses a rebuilt library starting from a previous campaign's final state. Setup routines and harnesses that only call
+# functions whose declarations are unchanged are re-validated in bulk, and only new or changed functions and the functions
+# that may follow them are explored further
+def begin_incremental(argBuilder, functions, compiler, init_sequences, previous):
+    global phase, phase_init_sequences, incremental_targets
+    signatures = functions.signatures()
+    changed = set(name for name in signatures if previous["signatures"].get(name) != signatures[name])
+    stale = changed | (set(previous["signatures"]) - set(signatures))
+    incremental_targets = functions.dependents(changed)
+    print(f"{len(changed)} new or changed function(s), exploring {len(incremental_targets)} function(s) affected by them")
+    reusable = lambda seq: not any(mem.name in stale for mem in seq.sequenceMembers)
+
+    routines = [seq for seq in previous["routines"] if reusable(seq)]
+    harnesses = [seq for seq in previous["harnesses"] if reusable(seq) and not seq.functionCount == 0]
+    revalidated = []
+    valid_harnesses = []
+    revalidateHarnesses(routines, revalidated, True)
+    revalidateHarnesses(harnesses, valid_harnesses)
+    routine_sequences = [seq for seq in revalidated if not seq.uninteresting_setup]
+    uninteresting_setup_routines = [seq for seq in revalidated if seq.uninteresting_setup]
+    print(f"Re-validated {len(revalidated)}/{len(routines)} setup routine(s) and {len(valid_harnesses)}/{len(harnesses)} harness(es)")
+    if not len(changed) and (len(revalidated) < len(routines) or len(valid_harnesses) < len(harnesses)):
+        print("WARNING: The library is unchanged but not everything re-validated, check that the seeds and options match the previous campaign")
+
+    # changed setup functions may now make different setup routines
+    argBuilder.current_setup_restrictions = previous["setup_restrictions"]
+    setup_sequences = init_sequences
+    if preamble_func != "" and len(changed & set(functions.setupFunctions)):
+        setup_sequences = call_preamble(preamble_func) or init_sequences
+    for seq in setup_sequences:
+        if scheduler.exhausted(compiler.evaluated):
+            break
+        argBuilder.auxiliary_functions = {}
+        for func in functions.setupFunctions:
+            if func == preamble_func or not func in changed:
+                continue
+            for s in argBuilder.buildSetupFunction(deepcopy(seq), func, set()):
+                if s.uninteresting_setup:
+                    uninteresting_setup_routines.append(s)
+                else:
+                    routine_sequences.append(s)
+                    compiler.updateRoutineLogs(s)
+
+    if not len(routine_sequences) and len(uninteresting_setup_routines):
+        print("No setup routines with input-dependent coverage, further exploring function calls\n")
+        routine_sequences = uninteresting_setup_routines
+    if not len(routine_sequences):
+        print("No setup routines survived the library update, harnessing from scratch")
+        incremental_targets = None
+        begin_harnessing(argBuilder, functions, compiler, init_sequences)
+        return
+
+    bestSequences = getBestHarnesses(compiler, routine_sequences, float("inf"))
+    setup_routines.extend(bestSequences)
+    print("")
+    for seq in bestSequences:
+        compiler.globalBitmap |= seq.bitmap
+        compiler.finalizeRoutineLogs(seq)
+        seq.functionCount = 0
+        seq.setupLen = len(seq.sequenceMembers)
+    compiler.sumRoutineLog()
+    bestHarnesses = getBestHarnesses(compiler, valid_harnesses, float("inf"))
+    for harness in bestHarnesses:
+        compiler.globalBitmap |= harness.bitmap
+        compiler.updateDebugLogs(harness)
+    print("")
+    phase, phase_init_sequences = "general", init_sequences
+    generateHarnesses(bestSequences + bestHarnesses)
+    finish_harnessing()
+
+
+# re-checks sequences from a previous campaign. The per-seed coverage they were saved with is their own and would make them
+# look like they gained nothing, so it is cleared and measured anew. Setup routines are checked as fresh setup routines,
+# harnesses keep their setup length and with it the full oracle
+def revalidateHarnesses(sequences, heap, routines=False):
+    for seq in sequences:
+        seq.seedCov = {}
+        if routines:
+            seq.setupLen = 0
+    analyzeHarnesses(sequences, heap, compiler)
+
+
+def finish_harnessing():
+    print("finished harness generation, beginning edge optimization")
+    compiler.currIterSuccesses = []
+    exit_routine()
+
+
+def scheduleHarness(sequence):
+    scheduler.reached |= sequence.targets
+    if sequence.functionCount >= numfuncs:
+        return
+    sequence_functions = set(mem.name for mem in sequence.sequenceMembers)
+    currentFunction = functions.getFunction(sequence.sequenceMembers[-1].name)
+    # every function that may follow the sequence's last call costs a round of candidates
+    followers = set(func.otherfunctionName for func in currentFunction.dependencies) - sequence_functions
+    if incremental_targets is not None:
+        followers &= incremental_targets
+    cost = len(followers)
+    if cost:
+        last = sequence.sequenceMembers[-1].name
+        distances = {target: 0 if target in sequence.targets else target_distances[target][last]
+                     for target in target_distances if target in sequence.targets or last in target_distances[target]}
+        scheduler.push(sequence, sequence.effectiveness, cost, distances)
+
+
+def expandHarness(sequence):
     compiler.currIterSuccesses = []
-    if sequence.functionCount < numfuncs:
-        localSequences = []
-        currentFunction = functions.getFunction(funcName)
-        prevFunctionName = None
-        sequence_functions = [mem.name for mem in sequence.sequenceMembers]
-        for func in currentFunction.dependencies:
-            if func.otherfunctionName != prevFunctionName:
-                compiler.currIterSequences = dict()
-            if not func.otherfunctionName in sequence_functions:
-                harnesses = argBuilder.buildArguments(deepcopy(sequence), func, set())
-                # temporarily store and update harnesses generated before optimization
-                for harness in harnesses:
-                    compiler.updateIterativeLogs(harness)
-                localSequences += harnesses
-                prevFunctionName = func.otherfunctionName
-        bestHarnesses = getBestHarnesses(compiler, localSequences, 10)
-        # refreshing stdout so everything previously written isn't overwritten
-        if len(bestHarnesses):
-            print("")
-        for harness in bestHarnesses:
-            compiler.globalBitmap = compiler.globalBitmap.union(harness.bitmap)
-            compiler.updateDebugLogs(harness)
-        if len(bestHarnesses):
-            print("")
-        for harness in bestHarnesses:
-            generateHarnesses(harness, harness.sequenceMembers[-1].name)
+    funcName = sequence.sequenceMembers[-1].name
+    localSequences = []
+    currentFunction = functions.getFunction(funcName)
+    prevFunctionName = None
+    sequence_functions = [mem.name for mem in sequence.sequenceMembers]
+    for func in currentFunction.dependencies:
+        # candidates are checked against the budget too, this just stops generating more of them
+        if scheduler.exhausted(compiler.evaluated):
+            break
+        if func.otherfunctionName != prevFunctionName:
+            compiler.currIterSequences = dict()
+        if incremental_targets is not None and not func.otherfunctionName in incremental_targets:
+            continue
+        if not func.otherfunctionName in sequence_functions:
+            harnesses = argBuilder.buildArguments(deepcopy(sequence), func, set())
+            # temporarily store and update harnesses generated before optimization
+            for harness in harnesses:
+                compiler.updateIterativeLogs(harness)
+            localSequences += harnesses
+            prevFunctionName = func.otherfunctionName
+    bestHarnesses = getBestHarnesses(compiler, localSequences, 10)
+    scheduler.record(funcName, len(bestHarnesses) > 0)
+    # refreshing stdout so everything previously written isn't overwritten
+    if len(bestHarnesses):
+        print("")
+    for harness in bestHarnesses:
+        compiler.globalBitmap |= harness.bitmap
+        compiler.updateDebugLogs(harness)
+    if len(bestHarnesses):
+        print("")
+    for harness in bestHarnesses:
+        scheduleHarness(harness)
 
 
 def analyzeHarness(localsequence, heap, compiler):
     check = compiler.checkSequence(localsequence)
-    if type(check) == set:
-        if len(check.difference(compiler.globalBitmap)) > 0:
+    recordHarness(localsequence, check, heap, compiler)
+
+
+# checks candidates (concurrently when --jobs > 1) and merges the results back in the order they were generated, returning
+# each candidate with its result. With --pipeline_depth, sequences may be a generator that is consumed while results come in
+def analyzeHarnesses(sequences, heap, compiler):
+    outcomes = []
+    for localsequence, check in compiler.streamSequences(sequences):
+        recordHarness(localsequence, check, heap, compiler)
+        outcomes.append((localsequence, check))
+    return outcomes
+
+
+def recordHarness(localsequence, check, heap, compiler):
+    if type(check) == int:
+        if check & ~compiler.globalBitmap:
             localsequence.bitmap = check
             heap.append(localsequence)
             for func in localsequence.sequenceMembers:
@@ -263,17 +486,19 @@ def process_config_file(filename):
     return set(blacklist), preamble_func, arg_keys, add_define_to_harness
 
 
-def begin_harnessing_target(argBuilder, functions, compiler, init_sequences, target_function_name):
+def begin_harnessing_target(argBuilder, functions, compiler, init_sequences, target_function_names):
+    global phase, phase_init_sequences
     routine_sequences = []
     uninteresting_sequences = []
-    potential_setup = False
-    target_function = functions.getFunction(target_function_name)
-    if target_function:
-        potential_setup = len(target_function.fuzz_args) > 0
-
-    # if targeted function is not a potential setup routine, then just move on
-    if not potential_setup:
-        print("Targeted function does not potentially consume fuzzer-generated data. Beginning to explore other setup routines")
+    setup_targets = []
+    for target_function_name in target_function_names:
+        target_function = functions.getFunction(target_function_name)
+        if target_function and len(target_function.fuzz_args) > 0:
+            setup_targets.append(target_function_name)
+
+    # if no targeted function is a potential setup routine, then just move on
+    if not len(setup_targets):
+        print("Targeted functions do not potentially consume fuzzer-generated data. Beginning to explore other setup routines")
         begin_harnessing(argBuilder, functions, compiler, init_sequences)
         return
 
@@ -285,22 +510,25 @@ def begin_harnessing_target(argBuilder, functions, compiler, init_sequences, tar
             print(f"Preamble function call had {len(preamble_harnesses)} successful invocation(s)")
             init_sequences = preamble_harnesses
 
-    # looping through the different restriction values
-    for i in range(1, 4):
-        if len(routine_sequences):
-            break # once we're able to successfully call the target function, move on
-        argBuilder.current_setup_restrictions = i
-        for seq in init_sequences:
-            if len(routine_sequences) and args.fast_mode:
-                break
-            compiler.currIterSequences = dict()
-            currSequences = argBuilder.buildSetupFunction(deepcopy(seq), target_function_name, set())
-            for s in currSequences:
-                if s.uninteresting_setup:
-                    uninteresting_sequences.append(s)
-                else:
-                    routine_sequences.append(s)
-                    compiler.updateRoutineLogs(s)
+    # looping through the different restriction values, separately for every target
+    for target_function_name in setup_targets:
+        target_sequences = []
+        for i in range(1, 4):
+            if len(target_sequences):
+                break # once we're able to successfully call the target function, move on
+            argBuilder.current_setup_restrictions = i
+            for seq in init_sequences:
+                if (len(target_sequences) and args.fast_mode) or scheduler.exhausted(compiler.evaluated):
+                    break
+                compiler.currIterSequences = dict()
+                currSequences = argBuilder.buildSetupFunction(deepcopy(seq), target_function_name, set())
+                for s in currSequences:
+                    if s.uninteresting_setup:
+                        uninteresting_sequences.append(s)
+                    else:
+                        target_sequences.append(s)
+                        compiler.updateRoutineLogs(s)
+        routine_sequences += target_sequences
 
     if not len(routine_sequences) and len(uninteresting_sequences):
         routine_sequences = uninteresting_sequences
@@ -309,20 +537,26 @@ def begin_harnessing_target(argBuilder, functions, compiler, init_sequences, tar
     # resetting target sequences and successful sequences to only contain minimized harness corpus
     compiler.targetSequences = []
     compiler.successfulSequences = []
+    setup_routines.extend(bestSequences)
     open(f"{output_dir}/debug-info/log_setup_routines.txt", "w")
     if len(bestSequences):
         print("")
     for seq in bestSequences:
-        compiler.globalBitmap = compiler.globalBitmap.union(seq.bitmap)
+        compiler.globalBitmap |= seq.bitmap
         compiler.finalizeRoutineLogs(seq)
     if len(bestSequences):
         print("")
-    print("Beginning to explore functions that can be called after target function")
+    print("Beginning to explore functions that can be called after the target functions")
 
     for seq in bestSequences:
         seq.functionCount = 0
         seq.setupLen = len(seq.sequenceMembers)
-        generateHarnesses(seq, seq.sequenceMembers[-1].name)
+    phase, phase_init_sequences = "target", init_sequences
+    generateHarnesses(bestSequences)
+
+    if scheduler.exhausted(compiler.evaluated):
+        finish_harnessing()
+        return
 
     # if targeted function is not a potential setup routine, then just move on
     print("Beginning to explore other setup routines")
@@ -339,6 +573,7 @@ def call_preamble(preamble_function):
 
 
 def begin_harnessing(argBuilder, functions, compiler, init_sequences):
+    global phase, phase_init_sequences
     argBuilder.current_setup_restrictions = 1
     routine_sequences = []
     uninteresting_setup_routines = []
@@ -352,7 +587,7 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
 
     for seq in init_sequences:
         argBuilder.auxiliary_functions = {}
-        if len(routine_sequences) and args.fast_mode:
+        if (len(routine_sequences) and args.fast_mode) or scheduler.exhausted(compiler.evaluated):
             break
         for func in functions.setupFunctions:
             if func == preamble_func:
@@ -365,12 +600,12 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
                     routine_sequences.append(s)
                     compiler.updateRoutineLogs(s)
 
-    if not compiler.func_targets and not len(routine_sequences):
+    if not compiler.func_targets and not len(routine_sequences) and not scheduler.exhausted(compiler.evaluated):
         print("No successful setup routines detected using strict buffer types, moving onto relaxed types")
         argBuilder.current_setup_restrictions = 2 # change how we want to restrict the injection of fuzzing data, this allows (void*) casts
         for seq in init_sequences:
             argBuilder.auxiliary_functions = {}
-            if len(routine_sequences) and args.fast_mode:
+            if (len(routine_sequences) and args.fast_mode) or scheduler.exhausted(compiler.evaluated):
                 break
             for func in functions.setupFunctions:
                 if func == preamble_func:
@@ -383,11 +618,11 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
                         routine_sequences.append(s)
                         compiler.updateRoutineLogs(s)
 
-    if not compiler.func_targets and not len(routine_sequences):
+    if not compiler.func_targets and not len(routine_sequences) and not scheduler.exhausted(compiler.evaluated):
         print("No successful setup routines detected using relaxed buffer types, moving onto exploring struct properties")
         argBuilder.current_setup_restrictions = 3 # change how we want to restrict the injection of fuzzing data, this allows struct property setting
         for seq in init_sequences:
-            if len(routine_sequences) and args.fast_mode:
+            if (len(routine_sequences) and args.fast_mode) or scheduler.exhausted(compiler.evaluated):
                 break
             for func in functions.setupFunctions:
                 currSequences = argBuilder.buildSetupFunction(deepcopy(seq), func, set())
@@ -409,6 +644,10 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
 
     if not len(routine_sequences):
         if not len(uninteresting_setup_routines):
+            if scheduler.exhausted(compiler.evaluated):
+                print("Harnessing budget exhausted before any setup routine was found")
+                finish_harnessing()
+                return
             print("No valid setup routines detected")
             exit()
         else:
@@ -416,13 +655,14 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
             routine_sequences = uninteresting_setup_routines
 
     bestSequences = getBestHarnesses(compiler, routine_sequences, float("inf"))
+    setup_routines.extend(bestSequences)
     if len(bestSequences):
         if not compiler.func_targets:
             open(f"{output_dir}/debug-info/log_setup_routines.txt", "w")
         # resetting target sequences and successful sequences to only contain minimized harness corpus
         print("")
         for seq in bestSequences:
-            compiler.globalBitmap = compiler.globalBitmap.union(seq.bitmap)
+            compiler.globalBitmap |= seq.bitmap
             compiler.finalizeRoutineLogs(seq)
         compiler.sumRoutineLog()
         print("")
@@ -430,11 +670,10 @@ def begin_harnessing(argBuilder, functions, compiler, init_sequences):
         for seq in bestSequences:
             seq.functionCount = 0
             seq.setupLen = len(seq.sequenceMembers)
-            generateHarnesses(seq, seq.sequenceMembers[-1].name)
+        phase, phase_init_sequences = "general", init_sequences
+        generateHarnesses(bestSequences)
 
-    print("finished harness generation, beginning edge optimization")
-    compiler.currIterSuccesses = []
-    exit_routine()
+    finish_harnessing()
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, handle_interrupt)
@@ -454,12 +693,35 @@ if __name__ == "__main__":
     parser.add_argument("--execute_both", "-e", action='store_true', help="Run harnesses both dynamically/statically linked. Useful for linker-related crashes.")
     parser.add_argument("--recurse_headers", "-x", action='store_true', help="Recursively parse all headers. Useful if compiling needs extra dependencies.")
     parser.add_argument("--fast_mode", "-f", action='store_true', help="Work faster by disabling exhaustive arg search, keeping only the first-successful one.")
-    parser.add_argument("--target_func", "-t", type=str, help="Attempt harnessing to reach only the specified function. Useful for targeted fuzzing.")
+    parser.add_argument("--target_func", "-t", type=str, nargs="+", help="Attempt harnessing to reach only the specified function(s), or those listed in a file. Useful for targeted fuzzing.")
     parser.add_argument("--allow_pvalret", "-ap", action="store_true", help="Store function call site arguments as potential arguments during harnessing.")
     parser.add_argument("--allow_stderr", "-as", action='store_true', help="Keeps harnesses where stderr output seen. Useful if stderr is valid API behavior.")
     parser.add_argument("--allow_lincov", "-al", action='store_true', help="Keeps harnesses with linear codecov deltas. Useful for low input-dependent logic.")
     parser.add_argument("--allow_consts", "-ac", action='store_true', help="Considers const args from one function as potential non-const args for others.")
     parser.add_argument("--allow_deepaux", "-ad", action="store_true", help="Arg resolution via deeper auxiliary sequences. Adds significant cost to harnessing.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of candidate harnesses to compile and execute concurrently, each in a private workspace.")
+    parser.add_argument("--batch_showmap", "-bs", action="store_true", help="Collect coverage for a whole seed directory with one afl-showmap run. Requires a showmap_batch Makefile target.")
+    parser.add_argument("--compile_cache", "-cc", type=str, help="Directory of a persistent cache of compiled harnesses, reused across candidates and campaigns.")
+    parser.add_argument("--coverage_cache", "-vc", action="store_true", help="Remember per-seed coverage of each harness binary in the output directory, kept when it is overwritten.")
+    parser.add_argument("--seed_store", "-ss", type=str, help="Directory (e.g. on a tmpfs) for the private seed copies harnesses are executed on. Defaults to the output directory.")
+    parser.add_argument("--staged_oracle", "-so", action="store_true", help="Screen each candidate on a few historically discriminative seeds before running it on the full corpus.")
+    parser.add_argument("--persistent", "-ps", action="store_true", help="Generate harnesses that run in an AFL persistent loop. Pair with --batch_showmap to avoid a process start per seed.")
+    parser.add_argument("--fuse", "-fu", type=int, default=1, help="Number of candidate harnesses compiled together into one binary, selected at run time.")
+    parser.add_argument("--parameterize", "-pz", action="store_true", help="Compile candidates that differ only in integer/enum/macro arguments once, reading those arguments from a table at run time.")
+    parser.add_argument("--exec_timeout", "-et", type=float, help="Seconds a harness may run on one seed before it counts as a hang. Defaults to a limit adapted to each seed's observed run time.")
+    parser.add_argument("--compile_timeout", "-ct", type=float, default=300, help="Seconds a single harness compilation may take.")
+    parser.add_argument("--coverage_engine", "-ce", choices=["showmap", "shm"], default="showmap", help="showmap: collect coverage through afl-showmap.\nshm: run harnesses directly against a shared-memory coverage map.")
+    parser.add_argument("--exec_rss", "-er", type=int, help="Memory cap in MB for harness executions, enforced through ASan's hard_rss_limit_mb.")
+    parser.add_argument("--budget", "-bu", type=float, help="Seconds after which no further harness sequences are extended and the final corpus is produced.")
+    parser.add_argument("--exec_budget", "-eb", type=int, help="Number of candidate harnesses compiled and executed after which no further sequences are extended.")
+    parser.add_argument("--queue", "-qu", type=str, help="Path to a campaign queue database that workers started with src/worker.py evaluate candidates from.")
+    parser.add_argument("--pipeline_depth", "-pd", type=int, default=0, help="Number of candidate harnesses generated ahead of evaluation, so that generation overlaps compiling and executing.")
+    parser.add_argument("--explore_rate", "-xr", type=float, default=0.3, help="Share of sampled argument values drawn uniformly rather than toward values that led to new coverage before. 1 samples uniformly.")
+    parser.add_argument("--minimize_seeds", "-ms", action="store_true", help="Run the campaign on a minimal subset of the seeds picked with the setup routines. The final harnesses are validated on all seeds.")
+    parser.add_argument("--incremental", "-in", type=str, help="Output directory of a campaign against an earlier build of the library. Only harnesses affected by changed functions are regenerated.")
+    parser.add_argument("--resume", "-rs", action="store_true", help="Continue the campaign checkpointed in the output directory instead of starting a new one.")
+    parser.add_argument("--checkpoint_interval", "-ci", type=float, default=600, help="Seconds between checkpoints of the campaign state, written to checkpoint.gz in the output directory. 0 disables them.")
+    parser.add_argument("--snapshot_interval", "-si", type=float, default=600, help="Seconds between snapshots of the best corpus so far written to snapshot/ in the output directory. 0 disables them.")
     #setting default vals
     includes = ["<stdio.h>", "<stdarg.h>", "<string.h>", "<stdlib.h>", "<stdint.h>"]
     fuzzDataType = "CHARACTER_S"
@@ -467,6 +729,11 @@ if __name__ == "__main__":
     
     numfuncs = args.numfuncs
 
+    # a single existing file lists the targets, one per line
+    if args.target_func and len(args.target_func) == 1 and os.path.isfile(args.target_func[0]):
+        with open(args.target_func[0], "r") as target_file:
+            args.target_func = [line.strip() for line in target_file if line.strip() and not line.strip().startswith("#")]
+
     if not args.headers[0]:
         print("Please supply the header files you want to explore")
 
@@ -496,13 +763,37 @@ if __name__ == "__main__":
     # get absolute path to output directory relative to to current working directory.
     output_dir = pathlib.Path(args.output).resolve()
 
-    if os.path.isdir(output_dir):
+    previous_state = None
+    if args.incremental and not args.resume:
+        previous_state = engine.Checkpoint(f"{os.path.abspath(args.incremental)}/final-harnesses", name="campaign.gz").load()
+        if previous_state is None:
+            print("WARNING: The provided previous output directory holds no final campaign state, exiting.")
+            exit()
+        if args.target_func:
+            print("WARNING: --incremental is not supported together with --target_func, harnessing from scratch")
+            previous_state = None
+
+    checkpoint = engine.Checkpoint(output_dir, args.checkpoint_interval)
+    resume_state = None
+    if args.resume:
+        resume_state = checkpoint.load()
+        if resume_state is None:
+            print("WARNING: No usable checkpoint found in the provided output directory, exiting.")
+            exit()
+    elif os.path.isdir(output_dir):
         if os.listdir(output_dir) == ["gen"]: # if the only thing that exists in the output directory is gen, just get rid of it.
             shutil.rmtree(output_dir)
         else:
             overwrite = input("WARNING: The provided output directory already contains artifacts from a previous harness generation trial. Are you sure you want to overwrite this? (y/n)\n")
             if overwrite in ["y", "yes"]:
-                shutil.rmtree(output_dir)
+                for entry in os.listdir(output_dir):
+                    # cached coverage is keyed on binary and seed contents, so it stays valid for the new campaign
+                    if args.coverage_cache and entry.startswith("coverage.db"):
+                        continue
+                    if os.path.isdir(f"{output_dir}/{entry}"):
+                        shutil.rmtree(f"{output_dir}/{entry}")
+                    else:
+                        os.remove(f"{output_dir}/{entry}")
             else:
                 print("Declined to overwrite output directory, exiting.")
                 exit()
@@ -514,7 +805,7 @@ if __name__ == "__main__":
     comp_mult_aliases = {}
 
 
-    os.makedirs(f"{output_dir}/gen")
+    os.makedirs(f"{output_dir}/gen", exist_ok=args.resume)
 
     compatibility = engine.CheckCompatibility(index.index, aliases, enums, args.target_func, track_params, allow_consts)
 
@@ -527,24 +818,60 @@ if __name__ == "__main__":
     dependencies.buildDependencies()
 
     if debug:
-        os.mkdir(f"{output_dir}/debug-info")
-        statFile = open(f"{output_dir}/debug-info/log_stats", "w")
-        statFile.write("Minute, Total Harnesses, Successful, Failure on Compilation, Failure on Coverage, Failure on Crash, Total Edges, Total APIs\n")
-        statFile.close()
+        os.makedirs(f"{output_dir}/debug-info", exist_ok=args.resume)
+        if not args.resume or not os.path.exists(f"{output_dir}/debug-info/log_stats"):
+            statFile = open(f"{output_dir}/debug-info/log_stats", "w")
+            statFile.write("Minute, Total Harnesses, Successful, Failure on Compilation, Failure on Coverage, Failure on Crash, Failure on Hang, Total Edges, Total APIs, Pruned\n")
+            statFile.close()
         dump_definitions(functions, macros, enums, fps, aliases, compatibility)
         dump_dependencies(functions)
         if track_params:
             dump_potential_args(functions)
 
+    # how many calls away each function is from each target, which steers the scheduler toward unreached targets
+    target_distances = {}
+    for target in args.target_func or []:
+        if not functions.getFunction(target):
+            print(f"WARNING: Targeted function {target} was not found in the provided headers")
+            continue
+        target_distances[target] = functions.distancesTo(target)
+
     print("Finished building dependencies")
 
-    shutil.copytree(f"{input_dir}/seeds_valid", f"{input_dir}/seeds_validcp", dirs_exist_ok=True)
-    shutil.copytree(f"{input_dir}/seeds_invalid", f"{input_dir}/seeds_invalidcp", dirs_exist_ok=True)
+    campaign_queue = None
+    if args.queue:
+        try:
+            campaign_queue = engine.CampaignQueue(os.path.abspath(args.queue))
+        except PermissionError as error:
+            print(f"WARNING: {error}, exiting.")
+            exit()
+        campaign_queue.reset()
+        campaign_queue.publish("settings", {"input_dir": input_dir, "includes": includes, "read_from_buffer": read_from_buffer,
+                                            "allow_stderr": allow_stderr, "target_func": args.target_func,
+                                            "execute_static_version": args.execute_both, "allow_lincov": allow_lincov,
+                                            "add_define_to_harness": add_define_to_harness, "batch_showmap": args.batch_showmap,
+                                            "staged_oracle": args.staged_oracle, "persistent": args.persistent,
+                                            "exec_timeout": args.exec_timeout, "compile_timeout": args.compile_timeout,
+                                            "exec_rss": args.exec_rss, "coverage_engine": args.coverage_engine})
 
     compiler = engine.CompileHarness(input_dir, output_dir, functions, enums, includes, read_from_buffer, debug, compatibility, 
-                                    allow_stderr, args.target_func, args.execute_both, allow_lincov, add_define_to_harness)
+                                    allow_stderr, args.target_func, args.execute_both, allow_lincov, add_define_to_harness, args.jobs, args.batch_showmap,
+                                    args.compile_cache, args.coverage_cache,
+                                    os.path.abspath(args.seed_store) if args.seed_store else None, args.staged_oracle,
+                                    args.persistent, args.fuse, args.parameterize, args.exec_timeout,
+                                    args.compile_timeout, args.exec_rss, args.coverage_engine, campaign_queue, args.pipeline_depth)
+    setup_routines = []  # minimized setup routines, the starting points of every harness
+    incremental_targets = None  # with --incremental, the only functions sequences are extended with
+    scheduler = engine.Scheduler(args.budget, args.exec_budget, args.snapshot_interval)
+    scheduler.targets = set(target_distances)
+    compiler.scheduler = scheduler
     argBuilder = harness_builder.Harness_Builder(functions, enums, macros, fps, compatibility,
-                                                 compiler, args.target_func, arg_keys, args.fast_mode, allow_complex_aux_sequences)
+                                                 compiler, args.target_func, arg_keys, args.fast_mode, allow_complex_aux_sequences,
+                                                 args.explore_rate, index.integer_macros)
+
+    if resume_state is not None:
+        resume_harnessing(resume_state)
+        exit()
 
     init_sequences = [engine.Sequence()]
     for init_seq in functions.initFunctions():
@@ -555,7 +882,9 @@ if __name__ == "__main__":
 
     print("Finished determining initialization routines, moving onto setup routines")
 
-    if args.target_func:
+    if previous_state is not None:
+        begin_incremental(argBuilder, functions, compiler, init_sequences, previous_state)
+    elif args.target_func:
         begin_harnessing_target(argBuilder, functions, compiler, init_sequences, args.target_func)
     else:
         begin_harnessing(argBuilder, functions, compiler, init_sequences)
@@ -1,5 +1,6 @@
 import multiplier as mx
 import engine
+import re
 
 class Index_Target_Header:
     def __init__(self, db_path, headers, recurse):
@@ -13,6 +14,7 @@ class Index_Target_Header:
         self.typedefs = {}
         self.fps = {}
         self.macros = []
+        self.integer_macros = set()
         self.builtIns = []
 
         self.get_includes()
@@ -85,6 +87,7 @@ class Index_Target_Header:
                 self.typedefs[typeDef.name].add(typeDef.underlying_type)
 
     def get_macrodefs(self):
+        bodies = {}
         for macro in mx.frontend.DefineMacroDirective.IN(self.index):
             if not self.contained_in_API_specific_header(macro):
                 continue
@@ -92,6 +95,24 @@ class Index_Target_Header:
                 # don't really care about function-like macros for now
                 continue
             self.macros.append(macro.name.data)
+            bodies[macro.name.data] = re.sub(r"^\s*#\s*define\s+\w+", "", macro.use_tokens.data)
+        self.get_integer_macros(bodies)
+
+    # macros whose body is an integer constant expression, built from integer literals, enum constants and other integer
+    # macros. Only these can be passed where the harness expects a plain integer value
+    def get_integer_macros(self, bodies):
+        integers = set(val for vals in self.enums.values() for val in vals)
+        found = True
+        while found:
+            found = False
+            for name, body in bodies.items():
+                if name in self.integer_macros:
+                    continue
+                tokens = re.findall(r"[A-Za-z_]\w*|0[xX][0-9a-fA-F]+[uUlL]*|\d+[uUlL]*|'(?:\\.|[^'\\])+'|<<|>>|\S", body)
+                if len(tokens) and all(re.fullmatch(r"0[xX][0-9a-fA-F]+[uUlL]*|\d+[uUlL]*|'.+'|<<|>>|[-+*/%|&^~()]", token)
+                                       or token in integers or token in self.integer_macros for token in tokens):
+                    self.integer_macros.add(name)
+                    found = True
 
 
     def get_functions(self):
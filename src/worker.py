@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import engine
+import os
+import socket
+import argparse
+import pathlib
+
+# evaluates candidate harnesses for a campaign started with --queue, possibly on another host that sees the same queue
+# database, Makefile and seeds. Results go back through the queue, so this process keeps no campaign state of its own
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queue", "-q", type=str, required=True, help="Path to the campaign queue database the coordinator was started with.")
+    parser.add_argument("--output", "-o", type=str, required=True, help="Private directory for this worker's scratch files and crash reproducers.")
+    parser.add_argument("--input", "-i", type=str, help="Path to the input directory on this host. Defaults to the coordinator's.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of candidate harnesses to compile and execute concurrently.")
+    parser.add_argument("--compile_cache", "-cc", type=str, help="Directory of a persistent cache of compiled harnesses on this host.")
+    parser.add_argument("--coverage_cache", "-vc", action="store_true", help="Remember per-seed coverage of each harness binary in the output directory.")
+    parser.add_argument("--seed_store", "-ss", type=str, help="Directory (e.g. on a tmpfs) for the private seed copies harnesses are executed on.")
+    args = parser.parse_args()
+
+    try:
+        campaign_queue = engine.CampaignQueue(os.path.abspath(args.queue))
+    except PermissionError as error:
+        print(f"WARNING: {error}, exiting.")
+        exit()
+    settings = campaign_queue.setting("settings")
+    if settings is None:
+        print("WARNING: The provided queue has no coordinator settings, exiting.")
+        exit()
+    if args.input:
+        settings["input_dir"] = os.path.abspath(args.input)
+
+    output_dir = pathlib.Path(args.output).resolve()
+    os.makedirs(f"{output_dir}/gen", exist_ok=True)
+
+    # candidates arrive rendered, so nothing that is only needed to generate harnesses is set up here
+    compiler = engine.CompileHarness(settings["input_dir"], output_dir, None, {}, settings["includes"], settings["read_from_buffer"],
+                                     False, None, settings["allow_stderr"], settings["target_func"], settings["execute_static_version"],
+                                     settings["allow_lincov"], settings["add_define_to_harness"], args.jobs, settings["batch_showmap"],
+                                     args.compile_cache, args.coverage_cache,
+                                     os.path.abspath(args.seed_store) if args.seed_store else None, settings["staged_oracle"],
+                                     settings["persistent"], 1, False, settings["exec_timeout"], settings["compile_timeout"],
+                                     settings["exec_rss"], settings["coverage_engine"], campaign_queue)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Worker {worker} serving {args.queue}")
+    try:
+        compiler.serveQueue(worker)
+    finally:
+        compiler.removeSeedStores()
+        compiler.closeCollectors()
+    print("Coordinator closed the queue, exiting.")